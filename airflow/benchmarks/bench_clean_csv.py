@@ -0,0 +1,92 @@
+"""Benchmark clean_csv on a synthetic trips file.
+
+Generates a trips CSV of the requested size (with a sprinkling of padded and
+malformed rows), cleans it, and reports throughput in MB/s and the peak RSS
+of the process. Peak RSS should stay flat as --size-mb grows.
+
+With --workers the parallel cleaner is run for each worker count and its
+output is checked to be byte-identical to the serial run. --engine arrow
+benchmarks the vectorized pyarrow cleaner instead.
+
+Usage: python benchmarks/bench_clean_csv.py --size-mb 2048 --workers 1 2 4
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import upload_files_to_s3  # noqa: E402
+
+HEADER = "timestamp,route,link,direction,stt,acc_stt,tcs1,tcs2\n"
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_synthetic_trips(path, size_mb, seed=0):
+    """Write a trips-shaped CSV of roughly size_mb megabytes."""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", buffering=1024 * 1024) as f:
+        f.write(HEADER)
+        while written < target:
+            block = []
+            for _ in range(10000):
+                route = rng.randint(1, 700)
+                stt = rng.randint(10, 600)
+                row = (f"2015111{rng.randint(0, 9)}-{rng.randint(0, 23):02d}{rng.randint(0, 59):02d},"
+                       f" {route},{rng.randint(1, 20)} ,{rng.randint(1, 4)},{stt},{stt * 2},"
+                       f"{rng.randint(1, 7000)},{rng.randint(1, 7000)}\n")
+                if rng.random() < 0.001:
+                    row = row.rsplit(",", 3)[0] + "\n"
+                block.append(row)
+            chunk = "".join(block)
+            f.write(chunk)
+            written += len(chunk)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--engine", choices=["python", "arrow"], default="python")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, "trips_1_day.csv")
+        size = write_synthetic_trips(raw_path, args.size_mb)
+        print(f"input: {size / 1024 ** 2:.0f} MB")
+
+        reference = None
+        baseline = None
+        for workers in args.workers:
+            upload_files_to_s3.LOCAL_CLEAN_DIR = os.path.join(tmp, f"clean_{workers}")
+            rss_before = peak_rss_mb()
+            started = time.perf_counter()
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                cleaned_path, _ = upload_files_to_s3.clean_csv(raw_path, workers=workers,
+                                                               engine=args.engine)
+            seconds = time.perf_counter() - started
+
+            baseline = baseline or seconds
+            identical = "" if reference is None else \
+                f", identical={filecmp.cmp(reference, cleaned_path, shallow=False)}"
+            reference = reference or cleaned_path
+            print(f"workers={workers}: {seconds:.2f} s, {size / 1024 ** 2 / seconds:.1f} MB/s, "
+                  f"speedup {baseline / seconds:.2f}x, peak RSS {peak_rss_mb():.1f} MB "
+                  f"(before: {rss_before:.1f} MB){identical}")
+
+
+if __name__ == "__main__":
+    main()
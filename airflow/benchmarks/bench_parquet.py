@@ -0,0 +1,46 @@
+"""Compare cleaned CSV and Parquet output on a synthetic trips file.
+
+Cleans the same synthetic trips CSV with the arrow engine once per output
+format and reports write time and output size of each.
+
+Usage: python benchmarks/bench_parquet.py --size-mb 512 --row-group-size 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import upload_files_to_s3  # noqa: E402
+from bench_clean_csv import write_synthetic_trips  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--row-group-size", type=int, default=upload_files_to_s3.PARQUET_ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, "trips_1_day.csv")
+        size = write_synthetic_trips(raw_path, args.size_mb)
+        print(f"input: {size / 1024 ** 2:.0f} MB (compression: {upload_files_to_s3.PARQUET_COMPRESSION})")
+
+        for output_format in ("csv", "parquet"):
+            out_path = os.path.join(tmp, f"trips_1_day_cleaned.{output_format}")
+            started = time.perf_counter()
+            upload_files_to_s3.clean_csv_arrow(
+                raw_path, out_path, os.path.join(tmp, "rejects.csv"),
+                output_format=output_format, row_group_size=args.row_group_size,
+            )
+            seconds = time.perf_counter() - started
+            out_size = os.path.getsize(out_path)
+            print(f"{output_format:8s}: {seconds:.2f} s, {out_size / 1024 ** 2:.1f} MB "
+                  f"({out_size / size:.0%} of input)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,26 @@
 import os
+import time
+import hashlib
+import resource
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from manifest import load_manifest, save_manifest
 
 # Define download directory
 AIRFLOW_HOME = os.getenv("AIRFLOW_HOME", "/usr/local/airflow")
 DOWNLOAD_DIR = os.path.join(AIRFLOW_HOME, "data", "raw")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
+# Bytes read from the socket and written to disk per iteration
+CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+
+# Concurrent downloads and per-file retries (exponential backoff between attempts)
+MAX_WORKERS = int(os.getenv("DOWNLOAD_MAX_WORKERS", 3))
+MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", 3))
+BACKOFF_SECONDS = float(os.getenv("DOWNLOAD_BACKOFF_SECONDS", 2))
+
 # Files to download
 files = {
     "trips_1_day": "https://data.smartdublin.ie/dataset/d083b9a8-bed7-444c-a387-d58318f31c5d/resource/3bf193dc-6029-42e7-987f-31ea5ae3c32f/download/trips-1-day.csv",
@@ -13,17 +28,255 @@ files = {
     "junctions": "https://data.smartdublin.ie/dataset/d083b9a8-bed7-444c-a387-d58318f31c5d/resource/80ab75fc-3e81-420e-8987-31140ccc24d8/download/junctions.csv"
 }
 
-def download_files():
-    # Download and save files
-    for name, url in files.items():
-        file_path = os.path.join(DOWNLOAD_DIR, f"{name}.csv")
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            print(f"Successfully downloaded and saved: {file_path}")
+# Optional expected sha256 per file name, checked after each download
+checksums = {}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _total_size(response, offset):
+    """Full size of the remote file from Content-Range or Content-Length, if known.
+
+    Unknown when the body is content-encoded: the header sizes then count the
+    encoded bytes, not the decoded ones written to disk.
+    """
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def _range_validator(response):
+    """Value for If-Range that pins a resumed download to this response's version.
+
+    Weak ETags are not allowed in If-Range, so Last-Modified is used instead.
+    """
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def download_file(url, file_path, expected_sha256=None, chunk_size=CHUNK_SIZE, session=None,
+                  etag=None, last_modified=None):
+    """Stream a URL to disk, resuming a previous partial download if present.
+
+    Data is written to ``<file_path>.part`` chunk by chunk and only renamed to
+    ``file_path`` once its size and sha256 have been validated, so a dropped
+    connection leaves a partial file that the next call continues with an
+    HTTP Range request instead of starting from zero. The ETag (or
+    Last-Modified) of the partial download is kept in
+    ``<file_path>.part.validator`` and sent as If-Range, so a source that
+    changed since replies with the whole new file instead of the rest of it.
+    A partial file without a validator is downloaded again from the start.
+
+    When ``etag``/``last_modified`` from a previous download are given and
+    ``file_path`` still exists, the request is conditional and a 304 reply
+    keeps the local file untouched.
+
+    :param url: URL to download
+    :param file_path: Final local path of the file
+    :param expected_sha256: Hex digest the downloaded file must match, if given
+    :param chunk_size: Bytes read from the response per iteration
+    :param session: Optional requests.Session to issue the request with
+    :param etag: ETag of the local copy, sent as If-None-Match
+    :param last_modified: Last-Modified of the local copy, sent as If-Modified-Since
+    :return: dict with bytes, seconds, bytes_per_sec, sha256, etag,
+        last_modified, not_modified and peak_rss_mb
+    """
+    http = session or requests
+    part_path = f"{file_path}.part"
+    validator_path = f"{part_path}.validator"
+    validator = None
+    if os.path.exists(part_path) and os.path.exists(validator_path):
+        with open(validator_path) as f:
+            validator = f.read().strip() or None
+    offset = os.path.getsize(part_path) if validator else 0
+    # Sizes and byte ranges refer to the encoded body, so ask for it unencoded
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers.update({"Range": f"bytes={offset}-", "If-Range": validator})
+    if not offset and os.path.exists(file_path):
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    started = time.monotonic()
+    with http.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 304 and ("If-None-Match" in headers or "If-Modified-Since" in headers):
+            return {
+                "bytes": os.path.getsize(file_path),
+                "resumed_from": 0,
+                "seconds": round(time.monotonic() - started, 3),
+                "bytes_per_sec": None,
+                "sha256": None,
+                "etag": response.headers.get("ETag", etag),
+                "last_modified": response.headers.get("Last-Modified", last_modified),
+                "not_modified": True,
+                "peak_rss_mb": round(peak_rss_mb(), 1),
+            }
+        if response.status_code == 416 and offset:
+            # Partial file already holds every byte the server has
+            total = _total_size(response, 0)
+            if total != offset:
+                os.remove(part_path)
+                os.remove(validator_path)
+                raise IOError(f"Range not satisfiable for {url}, discarded partial file")
+            mode = "ab"
+        elif response.status_code == 206:
+            mode = "ab"
+        elif response.status_code == 200:
+            # Fresh download, or the server ignored the Range header or the
+            # source changed since the partial download: start over
+            offset = 0
+            mode = "wb"
+            new_validator = _range_validator(response)
+            if new_validator:
+                with open(validator_path, "w") as f:
+                    f.write(new_validator)
+            elif os.path.exists(validator_path):
+                os.remove(validator_path)
         else:
-            print(f"Failed to download {name} from {url}")
+            raise IOError(f"Unexpected HTTP {response.status_code} for {url}")
+
+        total = _total_size(response, offset)
+        response_etag = response.headers.get("ETag")
+        response_last_modified = response.headers.get("Last-Modified")
+        sha256 = hashlib.sha256()
+        if mode == "ab":
+            with open(part_path, "rb") as existing:
+                for block in iter(lambda: existing.read(chunk_size), b""):
+                    sha256.update(block)
+
+        received = 0
+        with open(part_path, mode) as f:
+            if response.status_code != 416:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    received += len(chunk)
+
+    size = offset + received
+    if total is not None and size != total:
+        raise IOError(f"Incomplete download of {url}: got {size} of {total} bytes")
+    if expected_sha256 and sha256.hexdigest() != expected_sha256.lower():
+        os.remove(part_path)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        raise IOError(f"Checksum mismatch for {url}: {sha256.hexdigest()}")
+
+    os.replace(part_path, file_path)
+    if os.path.exists(validator_path):
+        os.remove(validator_path)
+    seconds = time.monotonic() - started
+    return {
+        "bytes": size,
+        "resumed_from": offset,
+        "seconds": round(seconds, 3),
+        "bytes_per_sec": round(received / seconds) if seconds > 0 else None,
+        "sha256": sha256.hexdigest(),
+        "etag": response_etag,
+        "last_modified": response_last_modified,
+        "not_modified": False,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """Session with a keep-alive connection pool shared by all download threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_with_retry(url, file_path, expected_sha256=None, session=None,
+                        max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS,
+                        etag=None, last_modified=None):
+    """Call download_file, retrying with exponential backoff on failure.
+
+    Each retry resumes from the partial file left by the failed attempt.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            stats = download_file(url, file_path, expected_sha256=expected_sha256, session=session,
+                                  etag=etag, last_modified=last_modified)
+            stats["attempts"] = attempt + 1
+            return stats
+        except (requests.RequestException, IOError) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"Attempt {attempt + 1} for {url} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def download_files(max_workers=MAX_WORKERS):
+    """Download all files concurrently over a shared session.
+
+    Wall-clock time is bounded by the largest file rather than the sum of all
+    files. ``max_workers=1`` downloads them one after another.
+
+    Sources are requested conditionally against the manifest, and each
+    manifest entry gets ``changed`` set so the upload and Redshift load tasks
+    can skip files whose content is the same as last run.
+    """
+    manifest = load_manifest()
+    stats = {}
+    with create_session(max_workers) as session, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                download_with_retry,
+                url,
+                os.path.join(DOWNLOAD_DIR, f"{name}.csv"),
+                checksums.get(name),
+                session,
+                etag=manifest.get(name, {}).get("etag"),
+                last_modified=manifest.get(name, {}).get("last_modified"),
+            ): (name, url)
+            for name, url in files.items()
+        }
+        for future in as_completed(futures):
+            name, url = futures[future]
+            file_path = os.path.join(DOWNLOAD_DIR, f"{name}.csv")
+            try:
+                stats[name] = future.result()
+            except (requests.RequestException, IOError) as e:
+                print(f"Failed to download {name} from {url}: {e}")
+                continue
+            entry = manifest.setdefault(name, {})
+            result = stats[name]
+            if result["not_modified"]:
+                entry["changed"] = False
+                print(f"Not modified since last run, keeping: {file_path}")
+            else:
+                entry["changed"] = result["sha256"] != entry.get("sha256")
+                entry["sha256"] = result["sha256"]
+                print(f"Successfully downloaded and saved: {file_path} "
+                      f"({result['bytes']} bytes, {result['bytes_per_sec']} B/s, "
+                      f"peak RSS {result['peak_rss_mb']} MB)")
+            entry.update({
+                "url": url,
+                "etag": result["etag"],
+                "last_modified": result["last_modified"],
+                "size": result["bytes"],
+            })
+            result["changed"] = entry["changed"]
+    save_manifest(manifest)
+    return stats
 
 if __name__ == "__main__":
-    download_files()
\ No newline at end of file
+    download_files()
@@ -1,60 +1,337 @@
 import os
+import json
+import time
+import boto3
 import psycopg2
 from dotenv import load_dotenv
+from manifest import (load_manifest, save_manifest, is_stage_current, mark_stage_done, parquet_sources,
+                      PARTITIONED_SOURCES)
 
 # Load environment variables
 load_dotenv()
 
-def copy_file_to_redshift(s3_file, table_name):
-    host = os.getenv('REDSHIFT_HOST')
-    port = os.getenv('REDSHIFT_PORT', 5439)
-    db = os.getenv('REDSHIFT_DB')
-    user = os.getenv('REDSHIFT_USER')
-    password = os.getenv('REDSHIFT_PASSWORD')
+# "truncate" reloads every table from scratch; "incremental" COPYs into a
+# staging table and replaces only the key range it covers in tables listed in
+# INCREMENTAL_KEYS (other tables are still truncated and reloaded); "swap"
+# COPYs into a shadow table and renames it over the live one, keeping the
+# replaced version as {table}_previous for rollback_swap()
+LOAD_MODE = os.getenv("LOAD_MODE", "truncate")
+INCREMENTAL_KEYS = {"trips_raw": "timestamp"}
+
+# Prefix under S3_BUCKET where the per-table COPY manifests are written
+COPY_MANIFEST_PREFIX = "_copy_manifests"
+
+# Table privileges copied onto the shadow table by swap_into_table, by their
+# aclitem letter; TRUNCATE/DROP use engine-specific letters and are not copied
+ACL_PRIVILEGES = {"r": "SELECT", "a": "INSERT", "w": "UPDATE", "d": "DELETE", "x": "REFERENCES", "t": "TRIGGER"}
+
+AWS_REGION = 'eu-west-2'
+s3_client = boto3.client('s3', region_name = AWS_REGION)
+
+
+def copy_format_clause(s3_file):
+    """COPY format options for a cleaned file, chosen by its extension.
+
+    Parquet columns are mapped to the table by position and must have
+    compatible types, so no header or delimiter options apply.
+    """
+    if s3_file.endswith(".parquet"):
+        return "FORMAT AS PARQUET"
+    return """FORMAT AS CSV
+        IGNOREHEADER 1
+        DELIMITER ','"""
+
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv('REDSHIFT_DB'),
+        user=os.getenv('REDSHIFT_USER'),
+        password=os.getenv('REDSHIFT_PASSWORD'),
+        host=os.getenv('REDSHIFT_HOST'),
+        port=os.getenv('REDSHIFT_PORT', 5439)
+    )
+
+
+def write_copy_manifest(table_name, s3_files):
+    """Write a Redshift COPY manifest listing s3_files and return its S3 key.
+
+    Each entry carries its content_length, which COPY requires for Parquet.
+    """
+    s3_bucket = os.getenv('S3_BUCKET')
+    entries = [
+        {
+            "url": f"s3://{s3_bucket}/{s3_file}",
+            "mandatory": True,
+            "meta": {"content_length": s3_client.head_object(Bucket=s3_bucket, Key=s3_file)["ContentLength"]},
+        }
+        for s3_file in s3_files
+    ]
+    manifest_key = f"{COPY_MANIFEST_PREFIX}/{table_name}.manifest"
+    s3_client.put_object(Bucket=s3_bucket, Key=manifest_key, Body=json.dumps({"entries": entries}).encode())
+    return manifest_key
+
+
+def partition_files(s3_file):
+    """Every object of s3_file's format in its year=/month= partition, sorted.
+
+    A key outside a Hive-style month partition is returned alone.
+    """
+    prefix = os.path.dirname(s3_file)
+    if not os.path.basename(prefix).startswith("month="):
+        return [s3_file]
+    paginator = s3_client.get_paginator("list_objects_v2")
+    extension = os.path.splitext(s3_file)[1]
+    keys = [obj["Key"]
+            for page in paginator.paginate(Bucket=os.getenv('S3_BUCKET'), Prefix=f"{prefix}/")
+            for obj in page.get("Contents", [])
+            if obj["Key"].endswith(extension)]
+    return sorted(set(keys) | {s3_file})
+
+
+def copy_command(table_name, s3_file, manifest_key=None):
+    """COPY statement for one S3 object, or for every object in a COPY manifest.
+
+    With a manifest Redshift loads the listed files in parallel across slices;
+    ``s3_file`` then only picks the format clause.
+    """
     s3_bucket = os.getenv('S3_BUCKET')
     iam_role = os.getenv('IAM_ROLE_ARN')
 
-    s3_path = f's3://{s3_bucket}/{s3_file}'
+    s3_path = f's3://{s3_bucket}/{manifest_key or s3_file}'
 
-    copy_command = f"""
+    return f"""
         COPY {table_name}
         FROM '{s3_path}'
         IAM_ROLE '{iam_role}'
-        FORMAT AS CSV
-        IGNOREHEADER 1
-        DELIMITER ',';
+        {copy_format_clause(s3_file)}{' MANIFEST' if manifest_key else ''};
     """
 
-    print(f"[INFO] Copying {s3_file} to Redshift table '{table_name}'")
 
-    conn = psycopg2.connect(
-        dbname=db,
-        user=user,
-        password=password,
-        host=host,
-        port=port
-    )
-    conn.autocommit = True
+def last_copy_count(cur):
+    """Rows loaded by the session's most recent COPY."""
+    cur.execute("SELECT pg_last_copy_count();")
+    return cur.fetchone()[0]
+
+
+def merge_into_table(cur, s3_file, table_name, key_column, manifest_key=None):
+    """COPY s3_file into a staging table and merge it into table_name.
+
+    Rows of table_name whose key falls inside the staged min/max key range are
+    replaced by the staged rows, so re-loading the same file is idempotent and
+    only that range changes. Runs on the caller's transaction; readers keep
+    seeing the previous rows until it commits.
+
+    :return: number of rows copied into staging
+    """
+    staging = f"{table_name}_staging"
+    key = f'"{key_column}"'
+    cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table_name});")
+    cur.execute(copy_command(staging, s3_file, manifest_key))
+    copied = last_copy_count(cur)
+    cur.execute(f"""
+        DELETE FROM {table_name}
+        WHERE {key} BETWEEN (SELECT min({key}) FROM {staging})
+                        AND (SELECT max({key}) FROM {staging});
+    """)
+    cur.execute(f"INSERT INTO {table_name} SELECT * FROM {staging};")
+    cur.execute(f"DROP TABLE {staging};")
+    return copied
+
+
+def grant_statements(cur, table_name, target):
+    """GRANT statements giving target the privileges other users hold on table_name.
+
+    Read from the table's ACL; the owner's own privileges are implicit and
+    skipped. Ownership itself is not copied: the loading user owns target.
+    """
+    cur.execute(f"""
+        SELECT pg_get_userbyid(c.relowner), array_to_string(c.relacl, ',')
+        FROM pg_class c
+        WHERE c.relname = '{table_name}' AND pg_table_is_visible(c.oid);
+    """)
+    row = cur.fetchone()
+    if not row or not row[1]:
+        return []
+    owner, acl = row
+    statements = []
+    for item in acl.split(","):
+        grantee, privileges = item.split("/")[0].split("=")
+        grantee = grantee.strip('"')
+        if grantee == owner:
+            continue
+        if not grantee:
+            grantee = "PUBLIC"
+        elif grantee.startswith("group "):
+            grantee = f'GROUP "{grantee[len("group "):]}"'
+        else:
+            grantee = f'"{grantee}"'
+        # A '*' after a privilege letter marks it as granted WITH GRANT OPTION
+        plain = [ACL_PRIVILEGES[p] for i, p in enumerate(privileges)
+                 if p in ACL_PRIVILEGES and privileges[i + 1:i + 2] != "*"]
+        with_option = [ACL_PRIVILEGES[p] for i, p in enumerate(privileges)
+                       if p in ACL_PRIVILEGES and privileges[i + 1:i + 2] == "*"]
+        if plain:
+            statements.append(f"GRANT {', '.join(plain)} ON {target} TO {grantee};")
+        if with_option:
+            statements.append(f"GRANT {', '.join(with_option)} ON {target} TO {grantee} WITH GRANT OPTION;")
+    return statements
+
+
+def swap_into_table(cur, s3_file, table_name, manifest_key=None):
+    """COPY s3_file into a shadow table and swap it in for table_name.
+
+    The live table keeps serving reads while the shadow table loads; the two
+    renames at the end take effect together when the caller's transaction
+    commits. The replaced table is kept as {table_name}_previous.
+
+    LIKE copies neither grants nor ownership, so the live table's grants are
+    re-applied to the shadow table. The loading user becomes its owner, so
+    loader and table owner should be the same user.
+
+    :return: number of rows copied into the shadow table
+    """
+    shadow = f"{table_name}_shadow"
+    previous = f"{table_name}_previous"
+    cur.execute(f"DROP TABLE IF EXISTS {shadow};")
+    # LIKE carries over the distribution and sort keys of the live table
+    cur.execute(f"CREATE TABLE {shadow} (LIKE {table_name});")
+    for statement in grant_statements(cur, table_name, shadow):
+        cur.execute(statement)
+    cur.execute(copy_command(shadow, s3_file, manifest_key))
+    copied = last_copy_count(cur)
+    cur.execute(f"DROP TABLE IF EXISTS {previous};")
+    cur.execute(f"ALTER TABLE {table_name} RENAME TO {previous};")
+    cur.execute(f"ALTER TABLE {shadow} RENAME TO {table_name};")
+    return copied
+
+
+def rollback_swap(table_name, conn=None):
+    """Swap {table_name}_previous back in for table_name in one transaction.
+
+    The table being replaced becomes the new {table_name}_previous, so a
+    second call undoes the rollback.
+
+    :return: True if the tables were swapped, False otherwise
+    """
+    shadow = f"{table_name}_shadow"
+    previous = f"{table_name}_previous"
+
+    own_conn = conn is None
+    conn = conn or get_connection()
+    conn.autocommit = False
     cur = conn.cursor()
 
     try:
-        cur.execute(f'TRUNCATE TABLE {table_name};')
-        cur.execute(copy_command)
-        print(f"[SUCCESS] {s3_file} loaded into {table_name}")
+        cur.execute(f"DROP TABLE IF EXISTS {shadow};")
+        cur.execute(f"ALTER TABLE {table_name} RENAME TO {shadow};")
+        cur.execute(f"ALTER TABLE {previous} RENAME TO {table_name};")
+        cur.execute(f"ALTER TABLE {shadow} RENAME TO {previous};")
+        conn.commit()
+        print(f"[SUCCESS] Rolled {table_name} back to its previous version")
+        return True
     except Exception as e:
-        print(f"[ERROR] Failed to load {s3_file}: {e}")
+        conn.rollback()
+        print(f"[ERROR] Failed to roll back {table_name}: {e}")
+        return False
     finally:
         cur.close()
-        conn.close()
+        if own_conn:
+            conn.close()
+
+
+def copy_file_to_redshift(s3_file, table_name, mode=None, conn=None):
+    """Load one S3 object, or a list of objects through a COPY manifest, into table_name.
+
+    :param s3_file: S3 key, or a list of keys; more than one key is loaded
+        with one manifest COPY
+    :param table_name: Target table
+    :param mode: "truncate", "incremental" or "swap", defaults to LOAD_MODE
+    :param conn: Open connection to reuse; a new one is opened and closed if None
+    :return: dict with table, files, rows_loaded and seconds, or None on failure
+    """
+    mode = mode or LOAD_MODE
+    if mode == "incremental" and table_name not in INCREMENTAL_KEYS:
+        mode = "truncate"
+    s3_files = [s3_file] if isinstance(s3_file, str) else list(s3_file)
+
+    print(f"[INFO] Copying {', '.join(s3_files)} to Redshift table '{table_name}' ({mode})")
+
+    own_conn = conn is None
+    conn = conn or get_connection()
+    # The incremental merge and the shadow swap each run as one transaction
+    transactional = mode in ("incremental", "swap")
+    conn.autocommit = not transactional
+    cur = conn.cursor()
+
+    try:
+        manifest_key = write_copy_manifest(table_name, s3_files) if len(s3_files) > 1 else None
+        started = time.monotonic()
+        if mode == "incremental":
+            rows = merge_into_table(cur, s3_files[0], table_name, INCREMENTAL_KEYS[table_name], manifest_key)
+            conn.commit()
+        elif mode == "swap":
+            rows = swap_into_table(cur, s3_files[0], table_name, manifest_key)
+            conn.commit()
+        else:
+            cur.execute(f'TRUNCATE TABLE {table_name};')
+            cur.execute(copy_command(table_name, s3_files[0], manifest_key))
+            rows = last_copy_count(cur)
+        seconds = round(time.monotonic() - started, 3)
+        print(f"[SUCCESS] {len(s3_files)} file(s) loaded into {table_name}: {rows} rows in {seconds}s")
+        return {"table": table_name, "files": s3_files, "rows_loaded": rows, "seconds": seconds}
+    except Exception as e:
+        if transactional:
+            conn.rollback()
+        print(f"[ERROR] Failed to load {', '.join(s3_files)}: {e}")
+        return None
+    finally:
+        cur.close()
+        if own_conn:
+            conn.close()
 
 def main():
-    file_table_map = {
-        "trips_1_day_cleaned.csv": "trips_raw",
-        "routes_cleaned.csv": "routes"
+    source_table_map = {
+        "trips_1_day": "trips_raw",
+        "routes": "routes"
     }
 
-    for s3_file, table in file_table_map.items():
-        copy_file_to_redshift(s3_file, table)
+    # Tables whose source file was already loaded in its current version are skipped
+    manifest = load_manifest()
+
+    # Group the S3 files of every table so each table gets one COPY. A
+    # partitioned source brings every file of its month, which the manifest
+    # COPY loads in parallel across slices (incremental mode then replaces
+    # the month's key range)
+    table_files = {}
+    for name, table in source_table_map.items():
+        # Partitioned sources are loaded from the key the upload step recorded;
+        # the flat name is only ever written for the other sources
+        s3_file = manifest.get(name, {}).get("s3_key")
+        if s3_file is None:
+            if name in PARTITIONED_SOURCES:
+                raise ValueError(f"No s3_key for {name} in the manifest; run the upload task to record "
+                                 f"its {PARTITIONED_SOURCES[name]}/year=/month= partition")
+            s3_file = f"{name}_cleaned.{'parquet' if name in parquet_sources() else 'csv'}"
+        if is_stage_current(manifest, name, "loaded"):
+            print(f"[INFO] Skipping {s3_file}: unchanged since last load into {table}")
+            continue
+        table_files.setdefault(table, []).extend((name, key) for key in partition_files(s3_file))
+
+    # One connection for every table
+    results = []
+    conn = get_connection()
+    try:
+        for table, sources in table_files.items():
+            result = copy_file_to_redshift([s3_file for _, s3_file in sources], table, conn=conn)
+            if result:
+                results.append(result)
+                for name in {name for name, _ in sources}:
+                    mark_stage_done(manifest, name, "loaded")
+                save_manifest(manifest)
+    finally:
+        conn.close()
+    # Returned per-table timings and row counts are pushed to XCom by the PythonOperator
+    return results
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,61 @@
+import os
+import json
+
+# Per-source state shared by the download, upload and load tasks
+AIRFLOW_HOME = os.getenv("AIRFLOW_HOME", "/usr/local/airflow")
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", os.path.join(AIRFLOW_HOME, "data", "manifest.json"))
+
+# Sources uploaded under Hive-style date partitions, keyed by source name with
+# the S3 prefix as value: trips/year=YYYY/month=MM/<name>_<YYYYMMDD>_cleaned.csv.
+# Their S3 key is only known from the manifest's s3_key.
+PARTITIONED_SOURCES = {"trips_1_day": "trips"}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Return the manifest as {source name: entry}, or {} if none exists yet.
+
+    An entry holds the ETag, Last-Modified, size and sha256 of the last
+    download, plus the sha256 each later stage last processed
+    (``uploaded_sha256``, ``loaded_sha256``).
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Atomically write the manifest so a crashed task never leaves it half written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def source_name(filename):
+    """Map 'routes.csv' or 'routes_cleaned.csv' to the manifest key 'routes'."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return name[:-len("_cleaned")] if name.endswith("_cleaned") else name
+
+
+def parquet_sources():
+    """Sources cleaned to typed Parquet instead of CSV, from the comma separated PARQUET_SOURCES.
+
+    Read at call time so the load task sees the value its .env provides; the
+    upload writes <name>_cleaned.parquet and the load COPYs that object.
+    """
+    return [name for name in os.getenv("PARQUET_SOURCES", "").split(",") if name]
+
+
+def is_stage_current(manifest, name, stage):
+    """True if ``stage`` already processed the currently downloaded version of ``name``."""
+    entry = manifest.get(name)
+    return bool(entry and entry.get("sha256") and entry.get(f"{stage}_sha256") == entry["sha256"])
+
+
+def mark_stage_done(manifest, name, stage):
+    """Record that ``stage`` processed the current version of ``name``."""
+    entry = manifest.get(name)
+    if entry and entry.get("sha256"):
+        entry[f"{stage}_sha256"] = entry["sha256"]
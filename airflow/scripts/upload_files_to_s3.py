@@ -1,7 +1,28 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import boto3
+from boto3.s3.transfer import TransferConfig
+from boto3.exceptions import S3UploadFailedError
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
 import os
+import io
+import csv
+import functools
+import mmap
+import time
+import shutil
+import hashlib
+import datetime
+import locale
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from manifest import (load_manifest, save_manifest, source_name, is_stage_current, mark_stage_done,
+                      parquet_sources, PARTITIONED_SOURCES)
 
 AWS_REGION = 'eu-west-2'
 BUCKET_NAME = 'dublin-trips-data-lake'
@@ -11,64 +32,634 @@ LOCAL_CLEAN_DIR = os.path.join(AIRFLOW_HOME, "data", "clean")
 # LOCAL_RAW_DIR = '../data/raw'
 # LOCAL_CLEAN_DIR = '../data/clean'
 
-s3_client = boto3.client('s3', region_name = AWS_REGION)
+# Multipart transfer settings per file, and how many files are uploaded at once
+MB = 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 16)) * MB,
+    multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNK_MB", 16)) * MB,
+    max_concurrency=int(os.getenv("S3_MAX_CONCURRENCY", 10)),
+)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 3))
 
-def clean_csv(file_path):
-    """Clean the CSV by validating rows and stripping whitespace."""
+# Every part thread of every concurrent upload shares this client, so its
+# connection pool (botocore defaults to 10) must hold one connection each
+s3_client = boto3.client(
+    's3', region_name = AWS_REGION,
+    config=Config(max_pool_connections=TRANSFER_CONFIG.max_request_concurrency * UPLOAD_WORKERS),
+)
+# S3 object metadata holding the sha256 of the raw file an object was cleaned from
+SOURCE_HASH_METADATA = "source-sha256"
+
+# Clean CSV sources straight into a streaming multipart upload, without
+# writing the cleaned file to local disk
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "false").lower() == "true"
+
+# Output buffer for the cleaned file, so rows are flushed to disk in large writes
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Parallel cleaning: number of worker processes (1 = serial) and the smallest
+# file / byte range worth handing to the process pool
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", 1))
+PARALLEL_MIN_FILE_BYTES = 64 * 1024 * 1024
+PARALLEL_MIN_CHUNK_BYTES = 8 * 1024 * 1024
+# Upper bound per range keeps each worker's decoded slice small on multi-GB files
+PARALLEL_MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Cleaning engine: "python" (line-by-line split on ',') or "arrow" (quote-aware,
+# vectorized pyarrow.csv reader that also casts known numeric columns)
+CLEAN_ENGINE = os.getenv("CLEAN_ENGINE", "python")
+# The streaming reader keeps a few dozen blocks in flight, so this bounds its memory
+ARROW_BLOCK_SIZE = 1024 * 1024
+MAX_REJECT_SAMPLES = 10
+
+# Redshift type of every typed raw column, keyed by lower-cased header name;
+# any other column stays a string (VARCHAR). This is the raw table DDL the
+# Parquet output relies on: COPY ... FORMAT AS PARQUET only loads a column
+# whose Parquet type matches, so the arrow engine casts to ARROW_TYPES of it.
+RAW_COLUMN_TYPES = {
+    "route": "INTEGER",
+    "link": "INTEGER",
+    "direction": "INTEGER",
+    "tcs1": "INTEGER",
+    "tcs2": "INTEGER",
+    "siteid": "INTEGER",
+    "stt": "DOUBLE PRECISION",
+    "acc_stt": "DOUBLE PRECISION",
+    "accstt": "DOUBLE PRECISION",
+    "x": "DOUBLE PRECISION",
+    "y": "DOUBLE PRECISION",
+}
+ARROW_TYPES = {"INTEGER": pa.int32(), "DOUBLE PRECISION": pa.float64()}
+ARROW_COLUMN_TYPES = {col: ARROW_TYPES[redshift_type] for col, redshift_type in RAW_COLUMN_TYPES.items()}
+# Row groups of Parquet output (see manifest.parquet_sources) hold PARQUET_ROW_GROUP_SIZE rows
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 1_000_000))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+
+# Values each cast accepts; integers are capped at ten digits so a match
+# always casts to int64 for the range check
+NUMBER_PATTERNS = {
+    pa.int32(): r"^-?[0-9]{1,10}$",
+    pa.float64(): r"^[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?$",
+}
+
+
+def split_fields(line):
+    """Split a raw CSV line on commas and strip whitespace from every field."""
+    return [field.strip() for field in line.strip().split(',')]
+
+
+def new_clean_stats():
+    """Counters collected by every cleaning engine and returned by clean_csv."""
+    return {"rows_read": 0, "rows_kept": 0, "rows_rejected": 0, "rejected_by_reason": {}, "samples": []}
+
+
+def merge_clean_stats(total, part):
+    """Add the counters of ``part`` into ``total`` (used to join parallel ranges)."""
+    for key in ("rows_read", "rows_kept", "rows_rejected"):
+        total[key] += part[key]
+    for reason, count in part["rejected_by_reason"].items():
+        total["rejected_by_reason"][reason] = total["rejected_by_reason"].get(reason, 0) + count
+    total["samples"].extend(part["samples"][:MAX_REJECT_SAMPLES - len(total["samples"])])
+    return total
+
+
+def reject_row(stats, rejects, reason, text):
+    """Count a rejected row and append it to the buffered rejects file."""
+    stats["rows_rejected"] += 1
+    stats["rejected_by_reason"][reason] = stats["rejected_by_reason"].get(reason, 0) + 1
+    if len(stats["samples"]) < MAX_REJECT_SAMPLES:
+        stats["samples"].append(text)
+    rejects.write(text + '\n')
+
+
+def csv_line(values):
+    """Format values as one CSV line, quoting fields that need it."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
+
+
+def clean_rows(lines, n_cols, stats, rejects):
+    """Yield cleaned data rows; lines whose column count differs from the header go to rejects."""
+    for line in lines:
+        stats["rows_read"] += 1
+        fields = split_fields(line)
+        if len(fields) == n_cols:
+            stats["rows_kept"] += 1
+            yield ','.join(fields)
+        else:
+            reason = "column_count" if line.strip() else "empty_line"
+            reject_row(stats, rejects, reason, line.rstrip('\r\n'))
+
+
+def iter_cleaned_lines(src, stats, rejects):
+    """Yield the cleaned header and rows of an open raw CSV as newline-terminated lines."""
+    header_line = src.readline()
+    if not header_line:
+        raise ValueError("file is empty")
+
+    # Clean header
+    header = split_fields(header_line)
+    rejects.write(header_line.rstrip('\r\n') + '\n')
+    yield ','.join(header) + '\n'
+
+    for row in clean_rows(src, len(header), stats, rejects):
+        yield row + '\n'
+
+
+def _clean_serial(file_path, out_path, rejects_path):
+    stats = new_clean_stats()
+    # Stream data lines straight into the cleaned file
+    with open(file_path, 'r') as src, \
+            open(out_path, 'w', buffering=WRITE_BUFFER_SIZE) as dst, \
+            open(rejects_path, 'w', buffering=WRITE_BUFFER_SIZE) as rejects:
+        dst.writelines(iter_cleaned_lines(src, stats, rejects))
+    return stats
+
+
+def split_byte_ranges(mm, start, n_chunks, min_chunk_bytes=PARALLEL_MIN_CHUNK_BYTES,
+                      max_chunk_bytes=PARALLEL_MAX_CHUNK_BYTES):
+    """Split mm[start:] into about n_chunks (start, end) ranges that each end on a newline.
+
+    Range sizes are clamped to [min_chunk_bytes, max_chunk_bytes].
+    """
+    size = len(mm)
+    step = max(min((size - start) // n_chunks, max_chunk_bytes), min_chunk_bytes, 1)
+    ranges = []
+    while start < size:
+        end = mm.find(b'\n', min(start + step, size) - 1)
+        end = size if end == -1 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _clean_range(file_path, start, end, n_cols, out_path, rejects_path):
+    """Worker: clean one newline-aligned byte range of file_path into out_path."""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode(locale.getpreferredencoding(False))
+    stats = new_clean_stats()
+    # newline=None gives the same universal-newline splitting as the serial reader
+    with open(out_path, 'w', buffering=WRITE_BUFFER_SIZE) as dst, \
+            open(rejects_path, 'w', buffering=WRITE_BUFFER_SIZE) as rejects:
+        lines = io.StringIO(text, newline=None)
+        dst.writelines(row + '\n' for row in clean_rows(lines, n_cols, stats, rejects))
+    return out_path, rejects_path, stats
+
+
+def _clean_parallel(file_path, out_path, rejects_path, workers):
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end = mm.find(b'\n') + 1
+        header_bytes = mm[:header_end] if header_end else mm[:]
+        if b'\r' in header_bytes.rstrip(b'\r\n') or not header_end:
+            # Old Mac line endings or a header-only file: not worth splitting
+            return _clean_serial(file_path, out_path, rejects_path)
+        ranges = split_byte_ranges(mm, header_end, workers * 4,
+                                   PARALLEL_MIN_CHUNK_BYTES, PARALLEL_MAX_CHUNK_BYTES)
+
+    header_line = header_bytes.decode(locale.getpreferredencoding(False))
+    header = split_fields(header_line)
+    part_paths = [(f"{out_path}.{i}", f"{rejects_path}.{i}") for i in range(len(ranges))]
+    stats = new_clean_stats()
+    try:
+        # Workers only receive offsets; each one maps the file itself
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_clean_range, file_path, start, end, len(header), *paths)
+                for (start, end), paths in zip(ranges, part_paths)
+            ]
+            with open(out_path, 'w', buffering=WRITE_BUFFER_SIZE) as dst, \
+                    open(rejects_path, 'w', buffering=WRITE_BUFFER_SIZE) as rejects:
+                dst.write(','.join(header) + '\n')
+                rejects.write(header_line.rstrip('\r\n') + '\n')
+                # Join the cleaned ranges in their original order
+                for future in futures:
+                    part_out, part_rejects, part_stats = future.result()
+                    merge_clean_stats(stats, part_stats)
+                    with open(part_out, 'r') as part:
+                        shutil.copyfileobj(part, dst, WRITE_BUFFER_SIZE)
+                    with open(part_rejects, 'r') as part:
+                        shutil.copyfileobj(part, rejects, WRITE_BUFFER_SIZE)
+    finally:
+        for paths in part_paths:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+    return stats
+
+
+def _open_batch_writer(out_path, schema, output_format, row_group_size=None):
+    """Return (write_batch, close) for a cleaned CSV or Parquet file.
+
+    Parquet batches are buffered until a full row group of ``row_group_size``
+    rows is available, so the row group size does not depend on the reader's
+    block size.
+    """
+    if output_format == "parquet":
+        row_group_size = row_group_size or PARQUET_ROW_GROUP_SIZE
+        writer = pq.ParquetWriter(out_path, schema, compression=PARQUET_COMPRESSION)
+        pending = []
+
+        def flush(final=False):
+            table = pa.Table.from_batches(pending, schema=schema)
+            n_rows = table.num_rows if final else table.num_rows // row_group_size * row_group_size
+            if n_rows:
+                writer.write_table(table.slice(0, n_rows), row_group_size=row_group_size)
+            pending[:] = table.slice(n_rows).to_batches()
+
+        def write_batch(batch):
+            pending.append(batch)
+            if sum(b.num_rows for b in pending) >= row_group_size:
+                flush()
+
+        def close():
+            flush(final=True)
+            writer.close()
+
+        return write_batch, close
+
+    sink = open(out_path, 'wb')
+    sink.write((','.join(schema.names) + '\n').encode())
+    writer = pv.CSVWriter(sink, schema, write_options=pv.WriteOptions(include_header=False))
+
+    def close():
+        writer.close()
+        sink.close()
+
+    return writer.write_batch, close
+
+
+def clean_csv_arrow(file_path, out_path, rejects_path, output_format="csv", row_group_size=None):
+    """Clean a CSV with pyarrow's vectorized, quote-aware reader.
+
+    Fields are trimmed, rows with the wrong number of columns or a value that
+    does not parse as its column's type are rejected, and numeric columns are
+    cast batch by batch. Empty lines and rows whose fields are all empty are
+    rejected as well. With ``output_format="parquet"`` the typed batches are
+    written as compressed Parquet instead of CSV.
+
+    Rejects are written in input order. Rows with the wrong column count keep
+    their source text; blank rows become empty lines and rows with a bad
+    value are written re-quoted from their trimmed fields.
+
+    :return: cleaning counters, see new_clean_stats
+    """
+    with open(file_path, 'r', newline='') as f:
+        header_line = f.readline()
+    header = [col.strip() for col in next(csv.reader([header_line]))]
+    types = [ARROW_COLUMN_TYPES.get(col.lower(), pa.string()) for col in header]
+    stats = new_clean_stats()
+    invalid_rows = []
+
+    def on_invalid_row(row):
+        # row.number is the 1-based line in the file, header included
+        invalid_rows.append((row.number, row.text))
+        return 'skip'
+
+    def write_rejects(pending):
+        for _, reason, text in sorted(pending, key=lambda reject: reject[0]):
+            reject_row(stats, rejects, reason, text)
+
+    reader = pv.open_csv(
+        file_path,
+        read_options=pv.ReadOptions(skip_rows=1, column_names=header, block_size=ARROW_BLOCK_SIZE),
+        parse_options=pv.ParseOptions(invalid_row_handler=on_invalid_row, ignore_empty_lines=False),
+        convert_options=pv.ConvertOptions(
+            column_types={col: pa.string() for col in header},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    schema = pa.schema([pa.field(col, col_type) for col, col_type in zip(header, types)])
+
+    write_batch, close = _open_batch_writer(out_path, schema, output_format, row_group_size)
+    with open(rejects_path, 'w', buffering=WRITE_BUFFER_SIZE) as rejects:
+        rejects.write(header_line.rstrip('\r\n') + '\n')
+        next_line = 2
+        for batch in reader:
+            stats["rows_read"] += batch.num_rows
+            # Line numbers of the batch rows: the next lines not skipped as invalid.
+            # The reader may have parsed ahead, so later invalid rows wait for their batch.
+            skipped = [number for number, _ in invalid_rows]
+            candidates = np.arange(next_line, next_line + batch.num_rows + len(skipped))
+            lines = candidates[~np.isin(candidates, skipped)][:batch.num_rows]
+            last_line = lines[-1] if batch.num_rows else next_line - 1
+            pending = [(number, "column_count", text) for number, text in invalid_rows if number <= last_line]
+            stats["rows_read"] += len(pending)
+            invalid_rows[:] = [(number, text) for number, text in invalid_rows if number > last_line]
+            next_line = last_line + 1
+            columns = [pc.utf8_trim_whitespace(col) for col in batch.columns]
+
+            # A row is valid if it has a non-empty field and every typed field parses.
+            # Whole-column casts succeed on clean batches; only a column whose cast
+            # fails is checked value by value against its number pattern.
+            empty = [pc.equal(col, '') for col in columns]
+            blank = functools.reduce(pc.and_, empty)
+            parses_all = pa.array([True] * batch.num_rows)
+            typed = {}
+            for i, (col, col_type) in enumerate(zip(columns, types)):
+                if col_type == pa.string():
+                    continue
+                try:
+                    typed[i] = pc.cast(pc.if_else(empty[i], pa.scalar(None, pa.string()), col), col_type)
+                except pa.ArrowInvalid:
+                    parses = pc.match_substring_regex(col, NUMBER_PATTERNS[col_type])
+                    if pa.types.is_integer(col_type):
+                        # A well-formed integer may still overflow the column
+                        info = np.iinfo(col_type.to_pandas_dtype())
+                        values = pc.cast(pc.if_else(parses, col, '0'), pa.int64())
+                        parses = pc.and_(parses, pc.and_(pc.greater_equal(values, info.min),
+                                                         pc.less_equal(values, info.max)))
+                    parses_all = pc.and_(parses_all, pc.or_(empty[i], parses))
+            valid = pc.and_(pc.invert(blank), parses_all)
+
+            trimmed = pa.RecordBatch.from_arrays(columns, names=header)
+            rejected = np.flatnonzero(pc.invert(valid).to_numpy(zero_copy_only=False))
+            is_blank = blank.to_numpy(zero_copy_only=False)
+            for i, row in zip(rejected, trimmed.take(pa.array(rejected, pa.int64())).to_pylist()):
+                if is_blank[i]:
+                    pending.append((lines[i], "empty_line", ""))
+                else:
+                    pending.append((lines[i], "bad_type", csv_line(row.values())))
+            write_rejects(pending)
+
+            # Empty numeric fields become nulls
+            kept = trimmed.filter(valid)
+            arrays = [
+                typed[i].filter(valid) if i in typed
+                else col if col_type == pa.string()
+                else pc.cast(pc.if_else(pc.equal(col, ''), pa.scalar(None, pa.string()), col), col_type)
+                for i, (col, col_type) in enumerate(zip(kept.columns, types))
+            ]
+            kept = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            stats["rows_kept"] += kept.num_rows
+            write_batch(kept)
+        close()
+        # Rows rejected after the last batch was produced
+        stats["rows_read"] += len(invalid_rows)
+        write_rejects([(number, "column_count", text) for number, text in invalid_rows])
+
+    return stats
+
+
+def clean_csv(file_path, workers=CLEAN_WORKERS, engine=CLEAN_ENGINE, output_format="csv"):
+    """Clean the CSV by validating rows and stripping whitespace.
+
+    Rows are streamed from the raw file to the cleaned file one line at a
+    time, so memory use stays constant regardless of the file size. With
+    ``workers > 1`` large files are split into newline-aligned byte ranges
+    that are cleaned in a process pool; the output is identical to the
+    serial cleaner. ``engine="arrow"`` uses clean_csv_arrow instead, and so
+    does ``output_format="parquet"`` since Parquet needs typed columns.
+
+    Rejected rows are written to ``<name>_rejects.csv`` next to the cleaned
+    file instead of being printed.
+
+    :return: (cleaned_path, stats) with the counters from new_clean_stats
+        plus ``rejects_path``, or (None, None) if cleaning failed
+    """
     try:
         os.makedirs(LOCAL_CLEAN_DIR, exist_ok=True)
-        cleaned_lines = []
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-
-        # Clean header
-        header = lines[0].strip().split(',')
-        header = [col.strip() for col in header]
-        cleaned_lines.append(','.join(header))
-
-        # Process data lines
-        for line in lines[1:]:
-            fields = [field.strip() for field in line.strip().split(',')]
-            if len(fields) == len(header):
-                cleaned_lines.append(','.join(fields))
-            else:
-                # print bad lines
-                print(f"Skipping malformed line: {line.strip()}")
-
-        # Save cleaned file
-        cleaned_filename = os.path.basename(file_path).replace(".csv", "_cleaned.csv")
+        cleaned_filename = os.path.basename(file_path).replace(".csv", f"_cleaned.{output_format}")
         cleaned_path = os.path.join(LOCAL_CLEAN_DIR, cleaned_filename)
-        with open(cleaned_path, 'w') as f:
-            for row in cleaned_lines:
-                f.write(row + '\n')
+        rejects_path = os.path.join(LOCAL_CLEAN_DIR, os.path.basename(file_path).replace(".csv", "_rejects.csv"))
+        tmp_path = f"{cleaned_path}.tmp"
+        tmp_rejects_path = f"{rejects_path}.tmp"
+
+        if engine == "arrow" or output_format == "parquet":
+            stats = clean_csv_arrow(file_path, tmp_path, tmp_rejects_path, output_format)
+        elif workers > 1 and os.path.getsize(file_path) >= PARALLEL_MIN_FILE_BYTES:
+            stats = _clean_parallel(file_path, tmp_path, tmp_rejects_path, workers)
+        else:
+            stats = _clean_serial(file_path, tmp_path, tmp_rejects_path)
 
-        return cleaned_path
+        os.replace(tmp_path, cleaned_path)
+        os.replace(tmp_rejects_path, rejects_path)
+        stats["rejects_path"] = rejects_path
+        print(f"Cleaned {file_path}: kept {stats['rows_kept']} of {stats['rows_read']} rows, "
+              f"rejected {stats['rows_rejected']} {stats['rejected_by_reason']}")
+        return cleaned_path, stats
 
     except Exception as e:
         print(f"Failed to clean {file_path}: {e}")
+        return None, None
+
+
+class UploadProgress:
+    """boto3 transfer callback recording bytes sent and throughput for one file.
+
+    boto3 calls it from several threads during a multipart upload.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.sent += bytes_amount
+
+    def stats(self):
+        seconds = time.monotonic() - self.started
+        return {
+            "bytes": self.sent,
+            "seconds": round(seconds, 3),
+            "bytes_per_sec": round(self.sent / seconds) if seconds > 0 else None,
+        }
+
+
+def file_sha256(path):
+    """Hex sha256 of a local file, read in WRITE_BUFFER_SIZE blocks."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(WRITE_BUFFER_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def first_trip_date(file_path):
+    """Date of the first data row's timestamp (YYYYMMDD-HHMM), or None if unparsable."""
+    with open(file_path, 'r') as f:
+        header = [col.lower() for col in split_fields(f.readline())]
+        fields = split_fields(f.readline())
+    index = header.index("timestamp") if "timestamp" in header else 0
+    try:
+        return datetime.datetime.strptime(fields[index][:8], "%Y%m%d").date()
+    except (IndexError, ValueError):
         return None
 
 
-def upload_files_to_s3(local_data_dir, bucket_name):
+def s3_key_for(file_path, output_format):
+    """S3 key of a cleaned file: flat for dimensions, date-partitioned for trips.
+
+    Trips are partitioned by the date of their first row (today if it cannot
+    be parsed), so each day lands in its own object under its month instead
+    of overwriting the previous upload.
+    """
+    file = os.path.basename(file_path)
+    name = source_name(file)
+    prefix = PARTITIONED_SOURCES.get(name)
+    if not prefix:
+        return file.replace(".csv", f"_cleaned.{output_format}")
+    day = first_trip_date(file_path) or datetime.date.today()
+    return f"{prefix}/year={day:%Y}/month={day:%m}/{name}_{day:%Y%m%d}_cleaned.{output_format}"
+
+
+def s3_object_matches(bucket_name, key, source_sha256):
+    """True if ``key`` exists and was cleaned from a raw file with this sha256."""
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return head.get("Metadata", {}).get(SOURCE_HASH_METADATA) == source_sha256
+
+
+def upload_file_to_s3(local_path, bucket_name, key, config=TRANSFER_CONFIG, metadata=None):
+    """Upload one file with multipart settings from ``config``.
+
+    :return: dict with bytes, seconds and bytes_per_sec
+    """
+    progress = UploadProgress()
+    extra_args = {"Metadata": metadata} if metadata else None
+    s3_client.upload_file(local_path, bucket_name, key, ExtraArgs=extra_args, Config=config, Callback=progress)
+    stats = progress.stats()
+    print(f'Uploaded {key} to S3 bucket {bucket_name} ({stats["bytes"]} bytes, {stats["bytes_per_sec"]} B/s)')
+    return stats
+
+
+class LineStream(io.RawIOBase):
+    """Read-only, non-seekable byte stream over an iterator of text lines.
+
+    Lets boto3 pull cleaned rows for a multipart upload as it needs them, so
+    rows are cleaned while earlier parts are still being sent.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        parts = []
+        have = len(self._buffer)
+        for line in self._lines:
+            parts.append(line)
+            have += len(line)
+            if 0 <= size <= have:
+                break
+        data = self._buffer + ''.join(parts).encode()
+        if size < 0:
+            self._buffer = b''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def stream_clean_to_s3(file_path, bucket_name, key, config=TRANSFER_CONFIG, metadata=None):
+    """Clean file_path and upload the cleaned rows to S3 as they are produced.
+
+    Uses the line-by-line cleaner; only the rejects file is written locally.
+
+    :return: cleaning stats (see clean_csv) with the upload stats under "upload"
+    """
+    os.makedirs(LOCAL_CLEAN_DIR, exist_ok=True)
+    rejects_path = os.path.join(LOCAL_CLEAN_DIR, os.path.basename(file_path).replace(".csv", "_rejects.csv"))
+    stats = new_clean_stats()
+    progress = UploadProgress()
+    with open(file_path, 'r') as src, open(rejects_path, 'w', buffering=WRITE_BUFFER_SIZE) as rejects:
+        stream = LineStream(iter_cleaned_lines(src, stats, rejects))
+        extra_args = {"Metadata": metadata} if metadata else None
+        s3_client.upload_fileobj(stream, bucket_name, key, ExtraArgs=extra_args, Config=config, Callback=progress)
+    stats["rejects_path"] = rejects_path
+    stats["upload"] = progress.stats()
+    print(f"Cleaned and streamed {file_path} to {key}: kept {stats['rows_kept']} of {stats['rows_read']} rows, "
+          f"rejected {stats['rows_rejected']} {stats['rejected_by_reason']}, "
+          f"{stats['upload']['bytes_per_sec']} B/s")
+    return stats
+
+
+def upload_files_to_s3(local_data_dir, bucket_name, max_workers=UPLOAD_WORKERS, stream=STREAM_UPLOADS):
     """Upload files in a directory to an S3 bucket
 
+    Each file is handed to an upload thread as soon as it is cleaned, so the
+    next file is cleaned while the previous one is uploading. Uploads run
+    ``max_workers`` at a time, each as a multipart upload configured by
+    TRANSFER_CONFIG. With ``stream=True`` CSV sources are cleaned inside the
+    upload itself (stream_clean_to_s3) and never written to local disk.
+
+    Each object carries the sha256 of its raw file in its metadata; a file
+    whose object already exists with the same hash is neither cleaned nor
+    uploaded again. The S3 key of each source is recorded in the manifest
+    for the Redshift load step.
+
     :param local_data_dir: Local directory path of files to upload
     :param bucket_name: Bucket to upload to
-    :return: None
+    :param max_workers: Number of files uploaded concurrently
+    :param stream: Stream cleaned CSV rows straight into S3
+    :return: dict of cleaning and upload stats per uploaded file
     """
 
+    # Files whose downloaded content was already uploaded are skipped
+    manifest = load_manifest()
+    parquet = parquet_sources()
+    clean_stats = {}
+
     # Loop through files and directory
     try:
-        for (root, dirs, files) in os.walk(local_data_dir):
-            for file in files:
-                local_file_path = os.path.join(root, file)
-
-                cleaned_path = clean_csv(local_file_path)
-                if cleaned_path:
-                    filename = os.path.basename(cleaned_path)
-                    # Upload each file to S3
-                    s3_client.upload_file(cleaned_path, bucket_name, filename)
-                    print(f'Uploaded {filename} to S3 bucket {bucket_name}')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for (root, dirs, files) in os.walk(local_data_dir):
+                for file in files:
+                    if not file.endswith(".csv"):
+                        continue  # .part/.part.validator of a download still in progress or failed
+                    local_file_path = os.path.join(root, file)
+                    name = source_name(file)
+                    if is_stage_current(manifest, name, "uploaded"):
+                        print(f"Skipping {file}: unchanged since last upload")
+                        continue
+
+                    output_format = "parquet" if name in parquet else "csv"
+                    key = s3_key_for(local_file_path, output_format)
+                    metadata = {SOURCE_HASH_METADATA: file_sha256(local_file_path)}
+                    manifest.setdefault(name, {})["s3_key"] = key
+                    if s3_object_matches(bucket_name, key, metadata[SOURCE_HASH_METADATA]):
+                        print(f"Skipping {file}: s3://{bucket_name}/{key} already has the same content")
+                        mark_stage_done(manifest, name, "uploaded")
+                        save_manifest(manifest)
+                        continue
+
+                    if stream and output_format == "csv":
+                        future = executor.submit(stream_clean_to_s3, local_file_path, bucket_name, key,
+                                                 metadata=metadata)
+                        futures[future] = (file, name)
+                        continue
+
+                    cleaned_path, stats = clean_csv(local_file_path, output_format=output_format)
+                    if cleaned_path:
+                        clean_stats[file] = stats
+                        # Upload in the background while the next file is cleaned
+                        future = executor.submit(upload_file_to_s3, cleaned_path, bucket_name, key,
+                                                 metadata=metadata)
+                        futures[future] = (file, name)
+
+            for future in as_completed(futures):
+                file, name = futures[future]
+                try:
+                    result = future.result()
+                except (S3UploadFailedError, ValueError) as e:
+                    print(f"Error: Failed to upload {file}: {e}")
+                    continue
+                if file in clean_stats:
+                    clean_stats[file]["upload"] = result
+                else:
+                    clean_stats[file] = result
+                mark_stage_done(manifest, name, "uploaded")
+                save_manifest(manifest)
     except FileNotFoundError as e:
         print(f"Error: The file {file} does not exist in the local directory.")
     except ClientError as e:
@@ -79,9 +670,11 @@ def upload_files_to_s3(local_data_dir, bucket_name):
         print("Error: Incomplete AWS credentials.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    return clean_stats
 
 def main():
-    upload_files_to_s3(LOCAL_RAW_DIR, BUCKET_NAME)
+    # Returned stats are pushed to XCom by the PythonOperator
+    return upload_files_to_s3(LOCAL_RAW_DIR, BUCKET_NAME)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Dockerfile puts airflow/scripts on PYTHONPATH; mirror that for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
@@ -0,0 +1,231 @@
+"""Tests for the streaming downloader against a local stand-in HTTP server."""
+
+import gzip
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_raw_data
+import manifest
+
+PAYLOAD = b"timestamp,route,link,direction,stt,acc_stt,tcs1,tcs2\n" * 5000
+ETAG = '"v1"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD at any path, honouring single 'bytes=N-' Range headers.
+
+    Range requests whose If-Range does not match ETAG get the whole body, and
+    with ``gzip`` set the body is gzipped for clients that accept it. With a
+    ``barrier`` set every request waits there until enough are in flight.
+    """
+
+    honour_range = True
+    gzip = False
+    barrier = None
+
+    def do_GET(self):
+        if self.barrier is not None:
+            try:
+                self.barrier.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass  # Serve anyway; the test checks barrier.broken
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and self.honour_range and if_range in (None, ETAG):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        if self.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/trips.csv"
+    httpd.shutdown()
+    RangeHandler.honour_range = True
+    RangeHandler.gzip = False
+    RangeHandler.barrier = None
+
+
+def test_download_streams_file_to_disk(server, tmp_path):
+    target = tmp_path / "trips.csv"
+    stats = download_raw_data.download_file(server, str(target), chunk_size=4096)
+
+    assert target.read_bytes() == PAYLOAD
+    assert not os.path.exists(f"{target}.part")
+    assert stats["bytes"] == len(PAYLOAD)
+    assert stats["resumed_from"] == 0
+    assert stats["peak_rss_mb"] > 0
+    assert not os.path.exists(f"{target}.part.validator")
+
+
+def test_download_asks_for_an_unencoded_body(server, tmp_path):
+    RangeHandler.gzip = True
+    target = tmp_path / "trips.csv"
+
+    download_raw_data.download_file(server, str(target))
+
+    assert target.read_bytes() == PAYLOAD
+
+
+def test_download_resumes_partial_file(server, tmp_path):
+    target = tmp_path / "trips.csv"
+    (tmp_path / "trips.csv.part").write_bytes(PAYLOAD[:1000])
+    (tmp_path / "trips.csv.part.validator").write_text(ETAG)
+
+    stats = download_raw_data.download_file(
+        server, str(target), expected_sha256=hashlib.sha256(PAYLOAD).hexdigest()
+    )
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats["resumed_from"] == 1000
+
+
+def test_download_restarts_when_source_changed_since_partial_file(server, tmp_path):
+    target = tmp_path / "trips.csv"
+    (tmp_path / "trips.csv.part").write_bytes(b"old version of the file")
+    (tmp_path / "trips.csv.part.validator").write_text('"v0"')
+
+    stats = download_raw_data.download_file(server, str(target))
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats["resumed_from"] == 0
+
+
+def test_download_restarts_partial_file_without_validator(server, tmp_path):
+    target = tmp_path / "trips.csv"
+    (tmp_path / "trips.csv.part").write_bytes(b"unknown bytes")
+
+    stats = download_raw_data.download_file(server, str(target))
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats["resumed_from"] == 0
+
+
+def test_download_completes_when_partial_file_is_whole(server, tmp_path):
+    target = tmp_path / "trips.csv"
+    (tmp_path / "trips.csv.part").write_bytes(PAYLOAD)
+    (tmp_path / "trips.csv.part.validator").write_text(ETAG)
+
+    stats = download_raw_data.download_file(server, str(target))
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats["resumed_from"] == len(PAYLOAD)
+
+
+def test_download_restarts_when_range_is_ignored(server, tmp_path):
+    RangeHandler.honour_range = False
+    target = tmp_path / "trips.csv"
+    (tmp_path / "trips.csv.part").write_bytes(b"stale bytes")
+    (tmp_path / "trips.csv.part.validator").write_text(ETAG)
+
+    stats = download_raw_data.download_file(server, str(target))
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats["resumed_from"] == 0
+
+
+def test_download_rejects_checksum_mismatch(server, tmp_path):
+    target = tmp_path / "trips.csv"
+
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        download_raw_data.download_file(server, str(target), expected_sha256="0" * 64)
+
+    assert not target.exists()
+    assert not os.path.exists(f"{target}.part")
+
+
+def test_download_with_retry_recovers_after_failure(server, tmp_path, monkeypatch):
+    calls = []
+    real_download_file = download_raw_data.download_file
+
+    def flaky_download_file(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise IOError("connection dropped")
+        return real_download_file(*args, **kwargs)
+
+    monkeypatch.setattr(download_raw_data, "download_file", flaky_download_file)
+    target = tmp_path / "trips.csv"
+
+    stats = download_raw_data.download_with_retry(server, str(target), backoff=0)
+
+    assert stats["attempts"] == 2
+    assert target.read_bytes() == PAYLOAD
+
+
+@pytest.fixture
+def manifest_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(download_raw_data, "load_manifest", lambda: manifest.load_manifest(path))
+    monkeypatch.setattr(download_raw_data, "save_manifest", lambda m: manifest.save_manifest(m, path))
+    return path
+
+
+def test_download_files_fetches_all_files_concurrently(server, tmp_path, monkeypatch, manifest_path):
+    monkeypatch.setattr(download_raw_data, "DOWNLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(download_raw_data, "files", {
+        "trips_1_day": server,
+        "routes": server,
+        "junctions": server,
+    })
+    # Only passed if all three requests are open at the same time
+    RangeHandler.barrier = threading.Barrier(3)
+
+    stats = download_raw_data.download_files(max_workers=3)
+
+    assert not RangeHandler.barrier.broken
+    assert set(stats) == {"trips_1_day", "routes", "junctions"}
+    for name in stats:
+        assert (tmp_path / f"{name}.csv").read_bytes() == PAYLOAD
+
+
+def test_download_files_marks_unchanged_sources(server, tmp_path, monkeypatch, manifest_path):
+    monkeypatch.setattr(download_raw_data, "DOWNLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(download_raw_data, "files", {"routes": server})
+
+    first = download_raw_data.download_files()
+    entries = manifest.load_manifest(manifest_path)
+    assert first["routes"]["changed"] is True
+    assert entries["routes"]["etag"] == ETAG
+    assert entries["routes"]["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+
+    manifest.mark_stage_done(entries, "routes", "uploaded")
+    manifest.save_manifest(entries, manifest_path)
+
+    second = download_raw_data.download_files()
+    entries = manifest.load_manifest(manifest_path)
+    assert second["routes"]["not_modified"] is True
+    assert entries["routes"]["changed"] is False
+    assert manifest.is_stage_current(entries, "routes", "uploaded")
+    assert not manifest.is_stage_current(entries, "routes", "loaded")
+    assert (tmp_path / "routes.csv").read_bytes() == PAYLOAD
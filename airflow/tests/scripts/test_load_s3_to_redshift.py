@@ -0,0 +1,285 @@
+"""Tests for the Redshift loader.
+
+SQL generation is checked against a recording stand-in connection; the
+incremental merge runs against a local Postgres started with pgserver, with
+COPY replaced by inserts of the rows the S3 file would hold.
+"""
+
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import load_s3_to_redshift
+
+
+class FakeCursor:
+    rowcount = 0
+    copy_count = 7
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(" ".join(sql.split()))
+
+    def fetchone(self):
+        if "relacl" in self.conn.statements[-1]:
+            return ("loader", "loader=arwdDxt/loader,dbt_cloud=r/loader,group readers=r*/loader")
+        return (self.copy_count,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.statements.append("COMMIT")
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+    def copies(self):
+        return [sql for sql in self.statements if sql.startswith("COPY")]
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(load_s3_to_redshift.psycopg2, "connect", lambda **kwargs: connection)
+    monkeypatch.setenv("S3_BUCKET", "bucket")
+    monkeypatch.setenv("IAM_ROLE_ARN", "arn:aws:iam::1:role/copy")
+    return connection
+
+
+def test_csv_files_are_copied_as_csv(conn):
+    stats = load_s3_to_redshift.copy_file_to_redshift("routes_cleaned.csv", "routes")
+
+    copy, = conn.copies()
+    assert conn.statements[-1] == "SELECT pg_last_copy_count();"
+    assert stats["rows_loaded"] == FakeCursor.copy_count
+    assert copy.startswith("COPY routes FROM 's3://bucket/routes_cleaned.csv'")
+    assert "FORMAT AS CSV IGNOREHEADER 1 DELIMITER ','" in copy
+
+
+def test_parquet_files_are_copied_as_parquet(conn):
+    assert load_s3_to_redshift.copy_file_to_redshift("trips_1_day_cleaned.parquet", "trips_raw")
+
+    copy, = conn.copies()
+    assert copy.endswith("FORMAT AS PARQUET;")
+    assert "IGNOREHEADER" not in copy
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(Bucket="bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        monkeypatch.setattr(load_s3_to_redshift, "s3_client", client)
+        yield client
+
+
+def read_copy_manifest(s3, table_name):
+    key = f"{load_s3_to_redshift.COPY_MANIFEST_PREFIX}/{table_name}.manifest"
+    return json.loads(s3.get_object(Bucket="bucket", Key=key)["Body"].read())
+
+
+def test_file_list_is_copied_through_a_manifest(conn, s3):
+    keys = ["trips/year=2015/month=11/a.parquet", "trips/year=2015/month=11/b.parquet"]
+    for key in keys:
+        s3.put_object(Bucket="bucket", Key=key, Body=b"x" * 10)
+
+    stats = load_s3_to_redshift.copy_file_to_redshift(keys, "trips_raw", conn=conn)
+
+    copy, = conn.copies()
+    assert copy.startswith("COPY trips_raw FROM 's3://bucket/_copy_manifests/trips_raw.manifest'")
+    assert copy.endswith("FORMAT AS PARQUET MANIFEST;")
+    entries = read_copy_manifest(s3, "trips_raw")["entries"]
+    assert [entry["url"] for entry in entries] == [f"s3://bucket/{key}" for key in keys]
+    assert all(entry["mandatory"] and entry["meta"]["content_length"] == 10 for entry in entries)
+    assert stats["files"] == keys
+    assert not hasattr(conn, "closed")
+
+
+def test_main_loads_every_table_over_one_connection(conn, s3, monkeypatch):
+    key = "trips/year=2015/month=11/trips_1_day_20151119_cleaned.csv"
+    earlier = "trips/year=2015/month=11/trips_1_day_20151118_cleaned.csv"
+    other_month = "trips/year=2015/month=10/trips_1_day_20151031_cleaned.csv"
+    for s3_file in (key, earlier, other_month, "routes_cleaned.csv"):
+        s3.put_object(Bucket="bucket", Key=s3_file, Body=b"x")
+    monkeypatch.setattr(load_s3_to_redshift, "load_manifest", lambda: {"trips_1_day": {"s3_key": key}})
+    monkeypatch.setattr(load_s3_to_redshift, "save_manifest", lambda manifest: None)
+
+    results = load_s3_to_redshift.main()
+
+    assert [result["table"] for result in results] == ["trips_raw", "routes"]
+    assert all(result["rows_loaded"] == FakeCursor.copy_count for result in results)
+    # Every file of the month goes into the trips manifest; routes is one plain COPY
+    assert [entry["url"] for entry in read_copy_manifest(s3, "trips_raw")["entries"]] == [
+        f"s3://bucket/{earlier}", f"s3://bucket/{key}"]
+    trips_copy, routes_copy = conn.copies()
+    assert trips_copy.endswith("MANIFEST;")
+    assert routes_copy.startswith("COPY routes FROM 's3://bucket/routes_cleaned.csv'")
+    assert conn.closed
+
+
+def test_main_refuses_to_guess_the_key_of_a_partitioned_source(conn, s3, monkeypatch):
+    # A flat object left from before trips were partitioned must not be reloaded
+    s3.put_object(Bucket="bucket", Key="trips_1_day_cleaned.csv", Body=b"x")
+    monkeypatch.setattr(load_s3_to_redshift, "load_manifest", lambda: {})
+
+    with pytest.raises(ValueError, match="No s3_key for trips_1_day"):
+        load_s3_to_redshift.main()
+    assert conn.copies() == []
+
+
+def test_incremental_mode_stages_and_merges_in_one_transaction(conn):
+    stats = load_s3_to_redshift.copy_file_to_redshift("trips.csv", "trips_raw", mode="incremental")
+
+    assert conn.autocommit is False
+    assert conn.statements[0] == "CREATE TEMP TABLE trips_raw_staging (LIKE trips_raw);"
+    assert conn.statements[1].startswith("COPY trips_raw_staging FROM 's3://bucket/trips.csv'")
+    assert conn.statements[2] == "SELECT pg_last_copy_count();"
+    assert conn.statements[3].startswith("DELETE FROM trips_raw WHERE \"timestamp\" BETWEEN")
+    assert conn.statements[4] == "INSERT INTO trips_raw SELECT * FROM trips_raw_staging;"
+    assert conn.statements[-1] == "COMMIT"
+    assert stats["rows_loaded"] == FakeCursor.copy_count
+    assert not any(sql.startswith("TRUNCATE") for sql in conn.statements)
+
+
+def test_incremental_mode_truncates_tables_without_a_key(conn):
+    assert load_s3_to_redshift.copy_file_to_redshift("routes_cleaned.csv", "routes", mode="incremental")
+
+    assert conn.statements[0] == "TRUNCATE TABLE routes;"
+
+
+def test_swap_mode_loads_a_shadow_table_and_renames_it_in(conn):
+    stats = load_s3_to_redshift.copy_file_to_redshift("routes_cleaned.csv", "routes", mode="swap")
+
+    assert conn.autocommit is False
+    assert conn.statements[:2] == ["DROP TABLE IF EXISTS routes_shadow;", "CREATE TABLE routes_shadow (LIKE routes);"]
+    # The live table's grants carry over to the shadow table
+    assert conn.statements[3:5] == [
+        'GRANT SELECT ON routes_shadow TO "dbt_cloud";',
+        'GRANT SELECT ON routes_shadow TO GROUP "readers" WITH GRANT OPTION;',
+    ]
+    assert conn.statements[5].startswith("COPY routes_shadow FROM 's3://bucket/routes_cleaned.csv'")
+    assert conn.statements[7:] == [
+        "DROP TABLE IF EXISTS routes_previous;",
+        "ALTER TABLE routes RENAME TO routes_previous;",
+        "ALTER TABLE routes_shadow RENAME TO routes;",
+        "COMMIT",
+    ]
+    assert stats["rows_loaded"] == FakeCursor.copy_count
+
+
+@pytest.fixture
+def postgres(tmp_path, monkeypatch):
+    pgserver = pytest.importorskip("pgserver")
+    psycopg2 = load_s3_to_redshift.psycopg2
+
+    server = pgserver.get_server(str(tmp_path / "pgdata"), cleanup_mode="stop")
+    uri = server.get_uri()
+    monkeypatch.setattr(load_s3_to_redshift, "get_connection", lambda: psycopg2.connect(uri))
+    with psycopg2.connect(uri) as setup, setup.cursor() as cur:
+        cur.execute('CREATE TABLE trips_raw ("timestamp" varchar, route int, stt float);')
+        # Redshift's pg_last_copy_count(), fed by the stand-in COPY below
+        cur.execute("CREATE FUNCTION pg_last_copy_count() RETURNS bigint LANGUAGE sql "
+                    "AS $$ SELECT current_setting('test.last_copy_count')::bigint $$;")
+
+    # S3 stand-in: COPY becomes an insert of the rows the object would hold
+    s3_objects = {}
+
+    def fake_copy_command(table_name, s3_file, manifest_key=None):
+        rows = s3_objects[s3_file]
+        values = ", ".join(f"('{ts}', {route}, {stt})" for ts, route, stt in rows)
+        return (f"INSERT INTO {table_name} VALUES {values}; "
+                f"SELECT set_config('test.last_copy_count', '{len(rows)}', true);")
+
+    monkeypatch.setattr(load_s3_to_redshift, "copy_command", fake_copy_command)
+    yield uri, s3_objects
+    server.cleanup()
+
+
+def fetch_trips(uri):
+    with load_s3_to_redshift.psycopg2.connect(uri) as conn, conn.cursor() as cur:
+        cur.execute('SELECT "timestamp", route, stt FROM trips_raw ORDER BY 1, 2;')
+        return cur.fetchall()
+
+
+def test_incremental_merge_on_postgres_replaces_only_the_new_range(postgres):
+    uri, s3_objects = postgres
+    s3_objects["day1.csv"] = [("20151119-0600", 1, 50.0), ("20151119-0605", 1, 55.0)]
+    s3_objects["day2.csv"] = [("20151120-0600", 1, 60.0), ("20151120-0605", 2, 65.0)]
+    s3_objects["day2_fixed.csv"] = [("20151120-0600", 1, 61.0)]
+
+    load_s3_to_redshift.copy_file_to_redshift("day1.csv", "trips_raw", mode="incremental")
+    load_s3_to_redshift.copy_file_to_redshift("day2.csv", "trips_raw", mode="incremental")
+    stats = load_s3_to_redshift.copy_file_to_redshift("day2.csv", "trips_raw", mode="incremental")
+    assert stats["rows_loaded"] == 2
+    assert fetch_trips(uri) == s3_objects["day1.csv"] + s3_objects["day2.csv"]
+
+    load_s3_to_redshift.copy_file_to_redshift("day2_fixed.csv", "trips_raw", mode="incremental")
+    assert fetch_trips(uri) == s3_objects["day1.csv"] + [("20151120-0600", 1, 61.0), ("20151120-0605", 2, 65.0)]
+
+
+def test_incremental_merge_on_postgres_rolls_back_on_failure(postgres):
+    uri, s3_objects = postgres
+    s3_objects["day1.csv"] = [("20151119-0600", 1, 50.0)]
+    s3_objects["bad.csv"] = [("20151119-0600", "not_a_route", 1.0)]
+    load_s3_to_redshift.copy_file_to_redshift("day1.csv", "trips_raw", mode="incremental")
+
+    assert not load_s3_to_redshift.copy_file_to_redshift("bad.csv", "trips_raw", mode="incremental")
+    assert fetch_trips(uri) == s3_objects["day1.csv"]
+
+
+def test_swap_on_postgres_keeps_previous_version_for_rollback(postgres):
+    uri, s3_objects = postgres
+    s3_objects["v1.csv"] = [("20151119-0600", 1, 50.0)]
+    s3_objects["v2.csv"] = [("20151119-0600", 1, 51.0), ("20151119-0605", 2, 52.0)]
+
+    load_s3_to_redshift.copy_file_to_redshift("v1.csv", "trips_raw", mode="swap")
+    stats = load_s3_to_redshift.copy_file_to_redshift("v2.csv", "trips_raw", mode="swap")
+    assert stats["rows_loaded"] == 2
+    assert fetch_trips(uri) == s3_objects["v2.csv"]
+
+    assert load_s3_to_redshift.rollback_swap("trips_raw")
+    assert fetch_trips(uri) == s3_objects["v1.csv"]
+    assert load_s3_to_redshift.rollback_swap("trips_raw")
+    assert fetch_trips(uri) == s3_objects["v2.csv"]
+
+
+def test_swap_on_postgres_keeps_grants_of_the_live_table(postgres):
+    uri, s3_objects = postgres
+    s3_objects["v1.csv"] = [("20151119-0600", 1, 50.0)]
+    with load_s3_to_redshift.psycopg2.connect(uri) as conn, conn.cursor() as cur:
+        cur.execute("CREATE ROLE dbt_cloud;")
+        cur.execute("GRANT SELECT ON trips_raw TO dbt_cloud;")
+
+    load_s3_to_redshift.copy_file_to_redshift("v1.csv", "trips_raw", mode="swap")
+
+    with load_s3_to_redshift.psycopg2.connect(uri) as conn, conn.cursor() as cur:
+        cur.execute("SELECT has_table_privilege('dbt_cloud', 'trips_raw', 'SELECT'), "
+                    "has_table_privilege('dbt_cloud', 'trips_raw', 'INSERT');")
+        assert cur.fetchone() == (True, False)
+
+
+def test_failed_swap_on_postgres_leaves_live_table_untouched(postgres):
+    uri, s3_objects = postgres
+    s3_objects["v1.csv"] = [("20151119-0600", 1, 50.0)]
+    s3_objects["bad.csv"] = [("20151119-0600", "not_a_route", 1.0)]
+    load_s3_to_redshift.copy_file_to_redshift("v1.csv", "trips_raw", mode="swap")
+
+    assert not load_s3_to_redshift.copy_file_to_redshift("bad.csv", "trips_raw", mode="swap")
+    assert fetch_trips(uri) == s3_objects["v1.csv"]
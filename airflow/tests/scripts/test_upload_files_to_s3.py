@@ -0,0 +1,314 @@
+"""Tests for the CSV cleaning stage of upload_files_to_s3."""
+
+import pytest
+
+import upload_files_to_s3
+
+RAW = (
+    "timestamp, route ,link,direction,stt,acc_stt,tcs1,tcs2\n"
+    "20151119-0608, 1,1,1,55,55,6006,2031\n"
+    "20151119-0608,1,2\n"
+    "\n"
+    "20151119-0609,2 ,1 ,2,  70,125,2031,6006  \n"
+)
+
+CLEANED = (
+    "timestamp,route,link,direction,stt,acc_stt,tcs1,tcs2\n"
+    "20151119-0608,1,1,1,55,55,6006,2031\n"
+    "20151119-0609,2,1,2,70,125,2031,6006\n"
+)
+
+
+@pytest.fixture
+def raw_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_files_to_s3, "LOCAL_CLEAN_DIR", str(tmp_path / "clean"))
+    path = tmp_path / "raw" / "trips_1_day.csv"
+    path.parent.mkdir()
+    path.write_text(RAW)
+    return path
+
+
+def test_clean_csv_strips_fields_and_drops_malformed_rows(raw_file, tmp_path):
+    cleaned_path, stats = upload_files_to_s3.clean_csv(str(raw_file))
+
+    assert cleaned_path == str(tmp_path / "clean" / "trips_1_day_cleaned.csv")
+    with open(cleaned_path) as f:
+        assert f.read() == CLEANED
+
+
+def test_clean_csv_writes_rejects_file_and_returns_counters(raw_file, tmp_path, capsys):
+    cleaned_path, stats = upload_files_to_s3.clean_csv(str(raw_file))
+
+    assert stats["rows_read"] == 4
+    assert stats["rows_kept"] == 2
+    assert stats["rows_rejected"] == 2
+    assert stats["rejected_by_reason"] == {"column_count": 1, "empty_line": 1}
+    assert stats["rejects_path"] == str(tmp_path / "clean" / "trips_1_day_rejects.csv")
+    with open(stats["rejects_path"]) as f:
+        assert f.read() == RAW.splitlines(True)[0] + "20151119-0608,1,2\n\n"
+    assert "Skipping malformed line" not in capsys.readouterr().out
+
+
+def test_clean_csv_returns_none_for_empty_file(raw_file):
+    raw_file.write_text("")
+
+    assert upload_files_to_s3.clean_csv(str(raw_file)) == (None, None)
+
+
+def test_parallel_clean_is_byte_identical_to_serial(raw_file, tmp_path, monkeypatch):
+    rows = [
+        f"2015111{i % 10}-06{i % 60:02d}, {i % 700},{i % 20} ,1,{i % 600},{i},6006,2031"
+        for i in range(5000)
+    ]
+    rows[17] = "20151119-0608,1,2"
+    rows[4000] = ""
+    raw_file.write_text(RAW.splitlines(True)[0] + "\r\n".join(rows[:2500]) + "\r\n" + "\n".join(rows[2500:]))
+
+    serial_path, serial_stats = upload_files_to_s3.clean_csv(str(raw_file), workers=1)
+    with open(serial_path, "rb") as f:
+        serial = f.read()
+    with open(serial_stats["rejects_path"], "rb") as f:
+        serial_rejects = f.read()
+
+    monkeypatch.setattr(upload_files_to_s3, "PARALLEL_MIN_FILE_BYTES", 0)
+    monkeypatch.setattr(upload_files_to_s3, "PARALLEL_MIN_CHUNK_BYTES", 1000)
+    parallel_path, parallel_stats = upload_files_to_s3.clean_csv(str(raw_file), workers=3)
+    with open(parallel_path, "rb") as f:
+        assert f.read() == serial
+    with open(parallel_stats["rejects_path"], "rb") as f:
+        assert f.read() == serial_rejects
+    assert parallel_stats == serial_stats
+    assert not list((tmp_path / "clean").glob("*.tmp*"))
+
+
+def test_split_byte_ranges_ends_every_range_on_a_newline():
+    data = b"header\n" + b"".join(b"row%d\n" % i for i in range(1000)) + b"last"
+
+    ranges = upload_files_to_s3.split_byte_ranges(data, 7, 8, min_chunk_bytes=1)
+
+    assert ranges[0][0] == 7 and ranges[-1][1] == len(data)
+    for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start and data[end - 1:end] == b"\n"
+
+
+def test_arrow_engine_trims_casts_and_counts_rejected_rows(raw_file):
+    raw_file.write_text(
+        RAW
+        + '20151119-0610,3,1,1,"12.5",12.5,2031,6006\n'
+        + "20151119-0611,abc,1,1,10,10,2031,6006\n"
+    )
+
+    cleaned_path, stats = upload_files_to_s3.clean_csv(str(raw_file), engine="arrow")
+
+    with open(cleaned_path) as f:
+        assert f.read() == (
+            "timestamp,route,link,direction,stt,acc_stt,tcs1,tcs2\n"
+            '"20151119-0608",1,1,1,55,55,6006,2031\n'
+            '"20151119-0609",2,1,2,70,125,2031,6006\n'
+            '"20151119-0610",3,1,1,12.5,12.5,2031,6006\n'
+        )
+    assert stats["rows_read"] == 6
+    assert stats["rows_rejected"] == 3
+    assert stats["rejected_by_reason"] == {"column_count": 1, "empty_line": 1, "bad_type": 1}
+
+
+def test_arrow_engine_writes_rejects_as_csv_in_input_order(raw_file):
+    raw_file.write_text(
+        RAW
+        + '20151119-0610,"a,b",1,1,10,10,2031,6006\n'
+        + "20151119-0611,1,2\n"
+    )
+
+    cleaned_path, stats = upload_files_to_s3.clean_csv(str(raw_file), engine="arrow")
+
+    with open(stats["rejects_path"]) as f:
+        assert f.read() == (
+            RAW.splitlines(True)[0]
+            + "20151119-0608,1,2\n"
+            + "\n"
+            + '20151119-0610,"a,b",1,1,10,10,2031,6006\n'
+            + "20151119-0611,1,2\n"
+        )
+    assert stats["rows_read"] == 6
+
+
+def test_arrow_engine_keeps_quoted_commas_together(raw_file, tmp_path):
+    raw_file.write_text(
+        "SiteID,X,Y,Location\n"
+        '1,316067,234568,"ABBEY ST, MARLBOROUGH ST"\n'
+        '2,316780,235268,"AMIENS STREET"\n'
+    )
+
+    stats = upload_files_to_s3.clean_csv_arrow(
+        str(raw_file), str(tmp_path / "out.csv"), str(tmp_path / "rejects.csv")
+    )
+
+    assert stats["rows_kept"] == 2 and stats["rows_rejected"] == 0
+    assert (tmp_path / "out.csv").read_text().splitlines()[1] == '1,316067,234568,"ABBEY ST, MARLBOROUGH ST"'
+
+
+def test_parquet_output_is_typed_and_split_into_row_groups(raw_file):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = [f"20151119-06{i % 60:02d},{i},1,1,{i % 600},{i},6006,2031" for i in range(250)]
+    raw_file.write_text(RAW.splitlines(True)[0] + "\n".join(rows) + "\n")
+
+    cleaned_path = raw_file.with_name("out.parquet")
+    stats = upload_files_to_s3.clean_csv_arrow(
+        str(raw_file), str(cleaned_path), str(raw_file.with_name("rejects.csv")),
+        output_format="parquet", row_group_size=100,
+    )
+
+    parquet_file = pq.ParquetFile(cleaned_path)
+    assert stats["rows_kept"] == 250
+    assert [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)] == [100, 100, 50]
+    # INTEGER and DOUBLE PRECISION columns of the raw tables
+    assert parquet_file.schema_arrow.field("route").type == pa.int32()
+    assert parquet_file.schema_arrow.field("stt").type == pa.float64()
+    assert parquet_file.read().column("route").to_pylist() == list(range(250))
+
+
+def test_arrow_engine_rejects_integers_outside_the_column_type(raw_file):
+    raw_file.write_text(
+        RAW.splitlines(True)[0]
+        + "20151119-0608,2147483647,1,1,55,55,6006,2031\n"
+        + "20151119-0609,2147483648,1,1,55,55,6006,2031\n"
+        + "20151119-0610,+3,1,1,55,55,6006,2031\n"
+    )
+
+    stats = upload_files_to_s3.clean_csv_arrow(
+        str(raw_file), str(raw_file.with_name("out.csv")), str(raw_file.with_name("rejects.csv"))
+    )
+
+    assert stats["rows_kept"] == 1
+    assert stats["rejected_by_reason"] == {"bad_type": 2}
+
+
+def test_clean_csv_names_parquet_output_by_extension(raw_file, tmp_path):
+    cleaned_path, stats = upload_files_to_s3.clean_csv(str(raw_file), output_format="parquet")
+
+    assert cleaned_path == str(tmp_path / "clean" / "trips_1_day_cleaned.parquet")
+    assert stats["rows_kept"] == 2
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    import boto3
+    from moto import mock_aws
+
+    import manifest
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    manifest_path = str(tmp_path / "manifest.json")
+    monkeypatch.setattr(upload_files_to_s3, "load_manifest", lambda: manifest.load_manifest(manifest_path))
+    monkeypatch.setattr(upload_files_to_s3, "save_manifest", lambda m: manifest.save_manifest(m, manifest_path))
+    with mock_aws():
+        client = boto3.client("s3", region_name=upload_files_to_s3.AWS_REGION)
+        client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": upload_files_to_s3.AWS_REGION},
+        )
+        monkeypatch.setattr(upload_files_to_s3, "s3_client", client)
+        yield client
+
+
+def test_multipart_upload_records_throughput(s3, tmp_path):
+    from boto3.s3.transfer import TransferConfig
+
+    local_path = tmp_path / "big_cleaned.csv"
+    local_path.write_bytes(b"x" * (11 * 1024 * 1024))
+    config = TransferConfig(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+
+    stats = upload_files_to_s3.upload_file_to_s3(str(local_path), "test-bucket", "big_cleaned.csv", config=config)
+
+    head = s3.head_object(Bucket="test-bucket", Key="big_cleaned.csv")
+    assert head["ContentLength"] == 11 * 1024 * 1024
+    assert head["ETag"].endswith('-3"')  # three multipart parts
+    assert stats["bytes"] == 11 * 1024 * 1024
+    assert stats["bytes_per_sec"] > 0
+
+
+def test_upload_files_to_s3_uploads_every_cleaned_file(s3, raw_file, tmp_path):
+    (raw_file.parent / "routes.csv").write_text("Route,Link\n1, 2\n")
+
+    stats = upload_files_to_s3.upload_files_to_s3(str(raw_file.parent), "test-bucket", max_workers=2)
+
+    keys = sorted(obj["Key"] for obj in s3.list_objects_v2(Bucket="test-bucket")["Contents"])
+    assert keys == ["routes_cleaned.csv", "trips/year=2015/month=11/trips_1_day_20151119_cleaned.csv"]
+    assert stats["routes.csv"]["upload"]["bytes"] == len("Route,Link\n1,2\n")
+
+
+def test_upload_files_to_s3_skips_files_of_a_failed_download(s3, raw_file, tmp_path):
+    (raw_file.parent / "routes.csv.part").write_text("Route,Link\n1,")
+    (raw_file.parent / "routes.csv.part.validator").write_text('"v1"')
+
+    upload_files_to_s3.upload_files_to_s3(str(raw_file.parent), "test-bucket")
+
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="test-bucket")["Contents"]]
+    assert keys == ["trips/year=2015/month=11/trips_1_day_20151119_cleaned.csv"]
+    assert set(upload_files_to_s3.load_manifest()) == {"trips_1_day"}
+
+
+def test_line_stream_reads_exact_sizes():
+    stream = upload_files_to_s3.LineStream(iter(["abc\n", "de\n", "fghij\n"]))
+
+    assert stream.read(2) == b"ab"
+    assert stream.read(5) == b"c\nde\n"
+    assert stream.read() == b"fghij\n"
+    assert stream.read(10) == b""
+
+
+def test_streamed_upload_matches_cleaned_file(s3, raw_file, tmp_path):
+    stats = upload_files_to_s3.upload_files_to_s3(str(raw_file.parent), "test-bucket", stream=True)
+
+    key = "trips/year=2015/month=11/trips_1_day_20151119_cleaned.csv"
+    body = s3.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+    assert body == CLEANED.encode()
+    assert not (tmp_path / "clean" / "trips_1_day_cleaned.csv").exists()
+    assert stats["trips_1_day.csv"]["rows_rejected"] == 2
+    assert stats["trips_1_day.csv"]["upload"]["bytes"] == len(CLEANED)
+
+
+def test_streamed_multipart_upload_of_large_file(s3, raw_file, monkeypatch):
+    from boto3.s3.transfer import TransferConfig
+
+    row = "20151119-0608, 1,1,1,55,55,6006,2031\n"
+    raw_file.write_text(RAW.splitlines(True)[0] + row * 300000)
+    config = TransferConfig(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+
+    stats = upload_files_to_s3.stream_clean_to_s3(str(raw_file), "test-bucket", "trips.csv", config=config)
+
+    head = s3.head_object(Bucket="test-bucket", Key="trips.csv")
+    assert head["ETag"].endswith('-3"')
+    assert head["ContentLength"] == stats["upload"]["bytes"]
+    assert stats["rows_kept"] == 300000
+
+
+def test_upload_skips_objects_with_the_same_source_hash(s3, raw_file, tmp_path, capsys):
+    key = "trips/year=2015/month=11/trips_1_day_20151119_cleaned.csv"
+    upload_files_to_s3.upload_files_to_s3(str(raw_file.parent), "test-bucket")
+    first = s3.head_object(Bucket="test-bucket", Key=key)
+    assert first["Metadata"]["source-sha256"] == upload_files_to_s3.file_sha256(str(raw_file))
+
+    stats = upload_files_to_s3.upload_files_to_s3(str(raw_file.parent), "test-bucket")
+
+    assert stats == {}
+    assert "already has the same content" in capsys.readouterr().out
+    assert s3.head_object(Bucket="test-bucket", Key=key)["LastModified"] == first["LastModified"]
+
+
+def test_s3_key_for_partitions_trips_by_first_row_date(raw_file, tmp_path):
+    routes = tmp_path / "routes.csv"
+    routes.write_text("Route,Link\n1,2\n")
+
+    assert upload_files_to_s3.s3_key_for(str(raw_file), "parquet") == \
+        "trips/year=2015/month=11/trips_1_day_20151119_cleaned.parquet"
+    assert upload_files_to_s3.s3_key_for(str(routes), "csv") == "routes_cleaned.csv"
+
+
+def test_s3_client_pool_holds_every_upload_thread():
+    pool = upload_files_to_s3.s3_client.meta.config.max_pool_connections
+
+    assert pool >= upload_files_to_s3.TRANSFER_CONFIG.max_request_concurrency * upload_files_to_s3.UPLOAD_WORKERS
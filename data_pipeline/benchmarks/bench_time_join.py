@@ -0,0 +1,118 @@
+"""Benchmark the fact_trips/dim_time join on a local Postgres.
+
+Renders the staging and dim_time models and the parse_custom_timestamp macro
+to plain SQL, the way `dbt compile` would, and runs them against synthetic
+trips in a throwaway Postgres started with pgserver. It then times the join
+fact_trips used to make, which parses trip_timestamp with the macro on both
+sides, against the join on the typed trip_ts column parsed once in
+stg_trips_raw.
+
+Usage: python benchmarks/bench_time_join.py --rows 2000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import jinja2
+import pgserver
+import psycopg2
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+# dim_time and the fact join as they were before trip_ts was parsed in staging
+DIM_TIME_BEFORE = """
+with base as (
+    select distinct trip_timestamp
+    from {{ ref('stg_trips_raw') }}
+)
+
+select
+    trip_timestamp,
+    {{ parse_custom_timestamp('trip_timestamp', 'date') }} as date,
+    {{ parse_custom_timestamp('trip_timestamp', 'time') }} as time
+from base
+"""
+
+JOIN_BEFORE = """
+select dt.date, dt.time, td.route, count(*), avg(td.stt)
+from {{ ref('stg_trips_raw') }} td
+left join dim_time_before dt
+    on {{ parse_custom_timestamp('td.trip_timestamp', 'date') }} = dt.date
+    and {{ parse_custom_timestamp('td.trip_timestamp', 'time') }} = dt.time
+group by 1, 2, 3
+"""
+
+JOIN_AFTER = """
+select dt.date, dt.time, td.route, count(*), avg(td.stt)
+from {{ ref('stg_trips_raw') }} td
+left join {{ ref('dim_time') }} dt
+    on td.trip_ts = dt.trip_ts
+group by 1, 2, 3
+"""
+
+
+def compile_sql(template):
+    """Render a model to SQL with the project's macros and stand-in dbt context."""
+    with open(os.path.join(PROJECT_DIR, "macros", "parse_timestamp.sql")) as f:
+        macros = f.read()
+    return jinja2.Template(macros + template).render(
+        ref=lambda name: name,
+        source=lambda schema, name: name,
+        config=lambda **kwargs: "",
+        is_incremental=lambda: False,
+        var=lambda name, default=None: default,
+    )
+
+
+def compile_model(path):
+    with open(os.path.join(PROJECT_DIR, "models", path)) as f:
+        return compile_sql(f.read())
+
+
+def timed(cur, sql):
+    started = time.perf_counter()
+    cur.execute(sql)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = pgserver.get_server(tmp, cleanup_mode="stop")
+        try:
+            with psycopg2.connect(server.get_uri()) as conn, conn.cursor() as cur:
+                # One row per route every minute across a month, as trips_raw holds it
+                cur.execute("""
+                    CREATE TABLE trips_raw AS
+                    SELECT to_char(timestamp '2015-11-01' + (i / 50) * interval '1 minute',
+                                   'YYYYMMDD-HH24MI')::varchar AS "timestamp",
+                           i %% 50 AS route, 1 AS link, 1 AS direction,
+                           (i %% 600)::float AS stt, (i %% 900)::float AS acc_stt,
+                           1 AS tcs1, 2 AS tcs2
+                    FROM generate_series(0, %s) AS i;
+                """, (args.rows - 1,))
+                cur.execute(f"CREATE VIEW stg_trips_raw AS {compile_model('staging/stg_trips_raw.sql')};")
+                cur.execute("ANALYZE trips_raw;")
+
+                dim_before = timed(cur, f"CREATE TABLE dim_time_before AS {compile_sql(DIM_TIME_BEFORE)};")
+                dim_after = timed(cur, f"CREATE TABLE dim_time AS {compile_model('marts/dim_time.sql')};")
+                cur.execute("ANALYZE dim_time_before; ANALYZE dim_time;")
+                print(f"rows: {args.rows}")
+                print(f"dim_time build: before {dim_before:.2f} s, after {dim_after:.2f} s")
+
+                for label, template in (("before", JOIN_BEFORE), ("after", JOIN_AFTER)):
+                    sql = compile_sql(template)
+                    best = min(timed(cur, sql) for _ in range(args.repeat))
+                    print(f"fact join {label:6s}: {best:.2f} s (best of {args.repeat}, {cur.rowcount} groups)")
+        finally:
+            server.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -35,3 +35,10 @@
         )
     {% endif %}
 {% endmacro %}
+
+{% macro parse_trip_ts(trip_timestamp_column) %}
+    case
+        when {{ trip_timestamp_column }} ~ '^[0-9]{8}-[0-9]{4}$'
+        then to_timestamp({{ trip_timestamp_column }}, 'YYYYMMDD-HH24MI')::timestamp
+    end
+{% endmacro %}
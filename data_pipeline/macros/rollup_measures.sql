@@ -0,0 +1,10 @@
+{% macro rollup_measures() %}
+    -- Additive measures only: a weighted average for any combination of rows
+    -- is sum(sum_stt) / sum(trip_count), never an average of averages
+    sum(trip_count) as trip_count,
+    -- fact_trips rows built before sum_travel_time was added keep it NULL
+    -- until a --full-refresh; rebuild it from their average so history counts
+    sum(coalesce(sum_travel_time, avg_travel_time * trip_count)) as sum_stt,
+    min(min_travel_time) as min_stt,
+    max(max_travel_time) as max_stt
+{% endmacro %}
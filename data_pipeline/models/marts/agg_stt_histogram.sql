@@ -0,0 +1,43 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key='date',
+        sort=['date', 'route'],
+        dist='route'
+    )
+}}
+
+-- Fixed-width travel time histogram per date, hour, route and trip type.
+-- Bucket counts merge exactly by summing, so p50/p95 for any filter are read
+-- off the cumulative counts to within one bucket of stt_bucket_seconds.
+with bucketed as (
+    select
+        trip_date,
+        extract(hour from trip_time)::int as hour,
+        route,
+        case
+            when stt > 300 then 'Long Trip'
+            else 'Short Trip'
+        end as trip_type,
+        floor(stt / {{ var('stt_bucket_seconds') }})::int * {{ var('stt_bucket_seconds') }} as stt_bucket_start
+    from {{ ref('stg_trips_raw') }}
+    where stt is not null and trip_date is not null
+    {% if is_incremental() %}
+    and trip_date >= (
+        select coalesce(max("date") - {{ var('fact_trips_lookback_days') }}, '1900-01-01'::date)
+        from {{ this }}
+    )
+    {% endif %}
+)
+
+select
+    trip_date as "date",
+    hour,
+    route,
+    trip_type,
+    stt_bucket_start,
+    stt_bucket_start + {{ var('stt_bucket_seconds') }} as stt_bucket_end,
+    count(*) as trip_count
+from bucketed
+group by 1, 2, 3, 4, 5
@@ -0,0 +1,13 @@
+{{ config(sort=['date', 'hour']) }}
+
+-- Hourly rollup of fact_trips; serves the hour-of-day charts under every
+-- dashboard filter (date range, hour range, trip type, route)
+select
+    "date",
+    extract(hour from "time")::int as hour,
+    route,
+    trip_type,
+    {{ rollup_measures() }}
+from {{ ref('fact_trips') }}
+where "date" is not null
+group by 1, 2, 3, 4
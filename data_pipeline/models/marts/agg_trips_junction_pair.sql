@@ -0,0 +1,15 @@
+{{ config(sort=['date', 'hour']) }}
+
+-- Hourly rollup of fact_trips per route and start/end junction pair; carries
+-- every dashboard filter column so the junction charts never scan fact_trips
+select
+    "date",
+    extract(hour from "time")::int as hour,
+    route,
+    trip_type,
+    junction_start,
+    junction_end,
+    {{ rollup_measures() }}
+from {{ ref('fact_trips') }}
+where "date" is not null
+group by 1, 2, 3, 4, 5, 6
@@ -0,0 +1,12 @@
+{{ config(sort=['date', 'route']) }}
+
+-- Per-route daily rollup of fact_trips for the route ranking and route
+-- performance over time charts
+select
+    "date",
+    route,
+    trip_type,
+    {{ rollup_measures() }}
+from {{ ref('fact_trips') }}
+where "date" is not null
+group by 1, 2, 3
@@ -1,3 +1,17 @@
+{{ config(dist='all', sort=['junction_id']) }}
+
+-- One row per junction_id, copied to every node so fact_trips joins it
+-- twice (start and end junction) without redistribution
+with ranked as (
+    select
+        junction_id,
+        x_coord,
+        y_coord,
+        junction_name,
+        row_number() over (partition by junction_id order by junction_name) as row_num
+    from {{ ref('stg_junctions') }}
+)
+
 select
     junction_id,
     x_coord,
@@ -7,4 +21,5 @@ select
         when x_coord is null or y_coord is null then 'Unknown Location'
         else junction_name || ', ' || cast(x_coord as text) || ', ' || cast(y_coord as text)
     end as full_location
-from {{ ref('stg_junctions') }}
+from ranked
+where row_num = 1
@@ -0,0 +1,55 @@
+{{ config(dist='all', sort=['route', 'link', 'direction']) }}
+
+-- Link geometry keyed like dim_routes. The source WKT writes its separators
+-- as the token "comma" (LINESTRING(x1 y1 comma x2 y2)); it is parsed once
+-- here into start/end coordinates and a standard WKT string.
+with ranked as (
+    select
+        route,
+        link,
+        direction,
+        wkt,
+        row_number() over (partition by route, link, direction order by wkt) as row_num
+    from {{ ref('stg_routes') }}
+    where wkt like 'LINESTRING(%)'
+),
+
+points as (
+    select
+        route,
+        link,
+        direction,
+        wkt,
+        split_part(substring(wkt, 12, length(wkt) - 12), ' comma ', 1) as start_point,
+        regexp_replace(substring(wkt, 12, length(wkt) - 12), '^.* comma ', '') as end_point
+    from ranked
+    where row_num = 1
+),
+
+coordinates as (
+    -- Links to a junction without a location have blank coordinates
+    select
+        route,
+        link,
+        direction,
+        wkt,
+        nullif(split_part(start_point, ' ', 1), '')::float as start_x,
+        nullif(split_part(start_point, ' ', 2), '')::float as start_y,
+        nullif(split_part(end_point, ' ', 1), '')::float as end_x,
+        nullif(split_part(end_point, ' ', 2), '')::float as end_y
+    from points
+)
+
+select
+    route,
+    link,
+    direction,
+    start_x,
+    start_y,
+    end_x,
+    end_y,
+    case
+        when start_x is not null and start_y is not null and end_x is not null and end_y is not null
+        then replace(wkt, ' comma ', ', ')
+    end as wkt
+from coordinates
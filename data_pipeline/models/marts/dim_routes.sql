@@ -1,10 +1,24 @@
-select distinct
+{{ config(dist='all', sort=['route', 'link', 'direction']) }}
+
+-- One row per (route, link, direction); the geometry lives in
+-- dim_route_geometry so this stays narrow enough to copy to every node
+with ranked as (
+    select
+        route,
+        link,
+        direction,
+        tcs1,
+        tcs2,
+        row_number() over (partition by route, link, direction order by tcs1, tcs2) as row_num
+    from {{ ref('stg_routes') }}
+)
+
+select
     route,
     link,
     direction,
     tcs1,
     tcs2,
-    wkt_clean,
     case
         when direction = 1 then 'North'
         when direction = 2 then 'South'
@@ -12,4 +26,5 @@ select distinct
         when direction = 4 then 'West'
         else 'Unknown'
     end as direction_name
-from {{ ref('stg_routes') }}
+from ranked
+where row_num = 1
@@ -1,11 +1,23 @@
+{{ config(dist='all', sort=['trip_ts']) }}
+
+-- One row per distinct trip timestamp, copied to every node so fact_trips joins it
 with base as (
     select distinct trip_timestamp
     from {{ ref('stg_trips_raw') }}
+),
+
+-- Parse each distinct timestamp once, the same way stg_trips_raw does
+parsed as (
+    select
+        trip_timestamp,
+        {{ parse_trip_ts('trip_timestamp') }} as trip_ts
+    from base
 )
 
 select
     trip_timestamp,
-    {{ parse_custom_timestamp('trip_timestamp', 'date') }} as date,
-    {{ parse_custom_timestamp('trip_timestamp', 'time') }} as time,
-    {{ parse_custom_timestamp('trip_timestamp', 'year_segment') }} as year_segment
-from base
\ No newline at end of file
+    trip_ts,
+    trip_ts::date as date,
+    trip_ts::time as time,
+    to_char(trip_ts, 'YYYY') as year_segment
+from parsed
\ No newline at end of file
@@ -1,6 +1,22 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key='date',
+        on_schema_change='append_new_columns',
+        sort=['date', 'route'],
+        dist='route'
+    )
+}}
+
+-- Columns added by append_new_columns stay NULL on days outside the lookback
+-- window until a --full-refresh; rollup_measures backfills sum_travel_time
+
 with trip_data as (
     select
         t.trip_timestamp,
+        t.trip_ts,
+        t.trip_date,
         t.route,
         t.link,
         t.direction,
@@ -8,7 +24,6 @@ with trip_data as (
         t.acc_stt,
         t.tcs1,
         t.tcs2,
-        r.wkt_clean,
         j1.junction_name as junction_start,
         j2.junction_name as junction_end,
         case 
@@ -17,13 +32,19 @@ with trip_data as (
             else 'Unknown'
         end as trip_type
     from {{ ref('stg_trips_raw') }} t
-    left join {{ ref('dim_routes') }} r
-        on t.route = r.route and t.link = r.link and t.direction = r.direction
     left join {{ ref('dim_junctions') }} j1
         on t.tcs1 = j1.junction_id
     left join {{ ref('dim_junctions') }} j2
         on t.tcs2 = j2.junction_id
     where t.stt is not null
+    {% if is_incremental() %}
+    -- Only re-aggregate whole days from the lookback window onwards; the
+    -- delete+insert on "date" replaces exactly those days in the target
+    and t.trip_date >= (
+        select coalesce(max("date") - {{ var('fact_trips_lookback_days') }}, '1900-01-01'::date)
+        from {{ this }}
+    )
+    {% endif %}
 )
 
 -- Aggregation layer for daily statistics
@@ -32,6 +53,9 @@ select
     dt.time,
     td.route,
     count(*) as trip_count,
+    -- sum_travel_time and trip_count merge exactly across groups; re-aggregate
+    -- with sum(sum_travel_time) / sum(trip_count), not by averaging averages
+    sum(td.stt) as sum_travel_time,
     avg(td.stt) as avg_travel_time,
     max(td.stt) as max_travel_time,
     min(td.stt) as min_travel_time,
@@ -41,7 +65,6 @@ select
     td.junction_end
 from trip_data td
 left join {{ ref('dim_time') }} dt
-    -- Extract the date and time components from both trip_timestamp and dim_time
-    on {{ parse_custom_timestamp('td.trip_timestamp', 'date') }} = dt.date
-    and {{ parse_custom_timestamp('td.trip_timestamp', 'time') }} = dt.time
+    -- trip_ts is parsed once in staging, so the join compares typed timestamps
+    on td.trip_ts = dt.trip_ts
 group by dt.date, dt.time, td.route, td.trip_type, td.junction_start, td.junction_end
\ No newline at end of file
@@ -1,6 +1,8 @@
 with trips_raw as (
     select
         "timestamp" as trip_timestamp,
+        -- Parsed once here so downstream models join and filter on typed columns
+        {{ parse_trip_ts('"timestamp"') }} as trip_ts,
         route::int,
         link::int,
         direction::int,
@@ -15,6 +17,9 @@ with trips_raw as (
 -- Normalize travel times (eg: remove outliers or cap extreme values)
 select
     trip_timestamp::varchar as trip_timestamp,
+    trip_ts,
+    trip_ts::date as trip_date,
+    trip_ts::time as trip_time,
     route,
     link,
     direction,
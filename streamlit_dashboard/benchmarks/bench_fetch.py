@@ -0,0 +1,105 @@
+"""Benchmark the ways the local cache can fetch a day of fact_trips.
+
+Loads synthetic fact_trips rows into a throwaway Postgres started with
+pgserver and reads them back with:
+
+- read_sql: pd.read_sql(chunksize=100000) over psycopg2, the path the
+  dashboard used before the cache streamed its refreshes
+- server_cursor: local_cache.iter_sql_chunks over psycopg2, a server-side
+  cursor turned into DataFrames chunk by chunk
+- adbc: local_cache.iter_sql_chunks over ADBC, Arrow record batches turned
+  into DataFrames column by column
+
+Every method runs in its own process and reports rows/s and the growth of
+peak RSS while fetching, so allocations made by Arrow and libpq count too.
+
+Usage: python benchmarks/bench_fetch.py --rows 2000000
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pgserver
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DAY = datetime.date(2015, 11, 19)
+QUERY = 'SELECT * FROM prod.fact_trips WHERE "date" = %(day)s'
+
+
+def fetch(method, uri, chunksize, results):
+    import adbc_driver_postgresql.dbapi as adbc
+    import pandas as pd
+
+    import local_cache
+
+    if method == "adbc":
+        conn = adbc.connect(uri)
+        chunks = local_cache.iter_sql_chunks(conn, QUERY, {"day": DAY})
+    elif method == "server_cursor":
+        conn = psycopg2.connect(uri)
+        chunks = local_cache.iter_sql_chunks(conn, QUERY, {"day": DAY}, chunksize)
+    else:
+        conn = psycopg2.connect(uri)
+        chunks = (local_cache.shrink_frame(chunk)
+                  for chunk in pd.read_sql(QUERY, con=conn, params={"day": DAY}, chunksize=chunksize))
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    rows = sum(len(chunk) for chunk in chunks)
+    seconds = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    conn.close()
+    # ru_maxrss is in KiB on Linux
+    results.put((rows, seconds, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunksize", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = pgserver.get_server(tmp, cleanup_mode="stop")
+        try:
+            with psycopg2.connect(server.get_uri()) as conn, conn.cursor() as cur:
+                # fact_trips grain: one row per minute, route, trip type and junction pair
+                cur.execute("""
+                    CREATE SCHEMA prod;
+                    CREATE TABLE prod.fact_trips AS
+                    SELECT %s::date AS "date",
+                           (time '00:00' + (i %% 1440) * interval '1 minute')::time AS "time",
+                           i %% 800 AS route, 1 + i %% 5 AS trip_count,
+                           (i %% 3000)::float AS sum_travel_time, (i %% 600)::float AS avg_travel_time,
+                           (i %% 900)::float AS max_travel_time, (i %% 60)::float AS min_travel_time,
+                           (i %% 5000)::float AS total_accumulated_stt,
+                           (ARRAY['Normal', 'Long', 'Short'])[1 + i %% 3] AS trip_type,
+                           i %% 700 AS junction_start, (i + 1) %% 700 AS junction_end
+                    FROM generate_series(0, %s) AS i;
+                """, (DAY, args.rows - 1))
+            conn.close()
+
+            print(f"rows: {args.rows}, chunksize: {args.chunksize}")
+            context = multiprocessing.get_context("spawn")
+            for method in ("read_sql", "server_cursor", "adbc"):
+                results = context.Queue()
+                process = context.Process(target=fetch, args=(method, server.get_uri(), args.chunksize, results))
+                process.start()
+                rows, seconds, peak_mb = results.get()
+                process.join()
+                print(f"{method:14s}: {rows / seconds:12,.0f} rows/s, {seconds:.2f} s, "
+                      f"peak RSS +{peak_mb:.0f} MB")
+        finally:
+            server.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+import adbc_driver_postgresql.dbapi as adbc
 from datetime import datetime
-import sys
 import logging
-import gc
+import numpy as np
+import duckdb
+from geometry import RouteGeometry, JunctionIndex
+from local_cache import LocalCache
 
 # Configuration
 st.set_page_config(
@@ -33,88 +38,181 @@ def get_db_engine():
         st.error("Failed to connect to database. Please check your credentials.")
         st.stop()
 
-# Data Loading with Memory Management
-@st.cache_data(persist="disk", show_spinner="Loading traffic data...", max_entries=1)
-def load_data():
-    engine = get_db_engine()
-    chunks = []
+# Local mirror of the marts below; chart queries never go to Redshift
+@st.cache_resource
+def get_local_cache():
+    return LocalCache()
+
+@st.cache_data(ttl=600, show_spinner="Refreshing local data cache...")
+def refresh_local_cache():
+    """Pull new days into the local cache at most every ten minutes.
+
+    :return: the cache's data version, which keys the cached query results
+    """
+    cache = get_local_cache()
+    # ADBC streams the refresh queries as Arrow batches instead of Python rows
+    url = make_url(st.secrets["redshift"]["url"]).set(drivername="postgresql")
+    try:
+        with adbc.connect(url.render_as_string(hide_password=False)) as conn:
+            written = cache.refresh(conn)
+        logger.info(f"Local cache refreshed: {written}")
+    except Exception as e:
+        # Serve the cached days while the warehouse is unreachable
+        logger.warning(f"Local cache refresh failed: {e}")
+    return cache.version()
+
+# Queries run on the cached marts with the sidebar filters in the WHERE
+# clause, so only the aggregates each chart draws come back.
+# {where} is filled by filter_clause(); values are always bound parameters.
+QUERIES = {
+    'by_hour': """
+        SELECT hour, SUM(trip_count) AS trip_count, SUM(sum_stt) AS sum_travel_time
+        FROM prod.agg_trips_hourly WHERE {where}
+        GROUP BY hour ORDER BY hour""",
+    'by_date': """
+        SELECT "date", SUM(trip_count) AS trip_count, SUM(sum_stt) AS sum_travel_time
+        FROM prod.agg_trips_hourly WHERE {where}
+        GROUP BY "date" ORDER BY 1""",
+    'by_route': """
+        SELECT route, SUM(trip_count) AS trip_count, SUM(sum_stt) AS sum_travel_time
+        FROM prod.agg_trips_hourly WHERE {where}
+        GROUP BY route""",
+    'stt_histogram': """
+        SELECT stt_bucket_start, stt_bucket_end, SUM(trip_count) AS trip_count
+        FROM prod.agg_stt_histogram WHERE {where}
+        GROUP BY stt_bucket_start, stt_bucket_end ORDER BY stt_bucket_start""",
+    'junction_pairs': """
+        SELECT junction_start, junction_end, SUM(trip_count) AS trip_count
+        FROM prod.agg_trips_junction_pair WHERE {where} AND junction_start IS NOT NULL AND junction_end IS NOT NULL
+        GROUP BY junction_start, junction_end ORDER BY trip_count DESC LIMIT 10""",
+    'start_junctions': """
+        SELECT junction_start, SUM(trip_count) AS trip_count
+        FROM prod.agg_trips_junction_pair WHERE {where} AND junction_start IS NOT NULL
+        GROUP BY junction_start ORDER BY trip_count DESC LIMIT 10""",
+    'end_junctions': """
+        SELECT junction_end, SUM(trip_count) AS trip_count
+        FROM prod.agg_trips_junction_pair WHERE {where} AND junction_end IS NOT NULL
+        GROUP BY junction_end ORDER BY trip_count DESC LIMIT 10""",
+}
+
+# Daily series for a handful of routes, picked after by_route is known
+ROUTE_DAILY_QUERY = """
+    SELECT "date", route, SUM(trip_count) AS trip_count, SUM(sum_stt) AS sum_travel_time
+    FROM prod.agg_trips_hourly WHERE {where} AND route IN %(routes)s
+    GROUP BY "date", route ORDER BY 1"""
+
+def filter_clause(date_range, hour_range, trip_type, route):
+    """SQL condition and bound parameters for the sidebar filters.
+
+    :return: (condition, params) for pd.read_sql
+    """
+    conditions = ['"date" BETWEEN %(start_date)s AND %(end_date)s',
+                  'hour BETWEEN %(start_hour)s AND %(end_hour)s']
+    params = {'start_date': date_range[0], 'end_date': date_range[1],
+              'start_hour': int(hour_range[0]), 'end_hour': int(hour_range[1])}
+    if trip_type != 'All':
+        conditions.append('trip_type = %(trip_type)s')
+        params['trip_type'] = trip_type
+    if route != 'All':
+        conditions.append('route = %(route)s')
+        params['route'] = int(route)
+    return ' AND '.join(conditions), params
+
+@st.cache_data(show_spinner="Loading filter options...", max_entries=4)
+def load_filter_options(data_version):
+    """Date bounds, trip types and routes offered by the sidebar."""
+    cache = get_local_cache()
+    bounds = cache.read_sql(
+        'SELECT MIN("date") AS min_date, MAX("date") AS max_date FROM prod.agg_trips_route_day')
+    trip_types = cache.read_sql(
+        "SELECT DISTINCT trip_type FROM prod.agg_trips_route_day WHERE trip_type IS NOT NULL ORDER BY 1")
+    routes = cache.read_sql(
+        "SELECT DISTINCT route FROM prod.agg_trips_route_day WHERE route IS NOT NULL ORDER BY 1")
+    return (bounds['min_date'].iloc[0], bounds['max_date'].iloc[0],
+            trip_types['trip_type'].tolist(), routes['route'].astype(int).tolist())
+
+# Data Loading
+@st.cache_data(show_spinner="Loading traffic data...", max_entries=32)
+def load_data(data_version, date_range, hour_range, trip_type, route):
+    """Run every chart query for one combination of sidebar filters on the local cache.
+
+    :param data_version: LocalCache.version(), so results are recomputed after a refresh
+    :return: dict of small aggregate DataFrames keyed like QUERIES, plus
+             'route_daily', after process_data; empty dict on failure
+    """
+    cache = get_local_cache()
+    where, params = filter_clause(date_range, hour_range, trip_type, route)
 
     try:
-        # Load fact_trips in chunks
-        with st.spinner("Loading trip data..."):
-            with engine.connect() as conn:
-                for chunk in pd.read_sql(
-                    """SELECT route, "date", "time", avg_travel_time, trip_count, trip_type, junction_start, junction_end FROM prod.fact_trips LIMIT 200000""",
-                    con=conn.connection,
-                    chunksize=100000
-                ):
-                    chunks.append(chunk)
-                    if sys.getsizeof(chunks) > 700 * 1024 * 1024:  # ~700MB limit
-                        st.warning("Reached memory safety limit during load")
-                        break
-
-        fact_trips = pd.concat(chunks) if chunks else pd.DataFrame()
-
-        # Load dimension tables
-        dim_tables = {}
-        dim_queries = {
-            'dim_routes': "SELECT route, link, direction_name FROM prod.dim_routes",
-            'dim_junctions': "SELECT junction_id, junction_name FROM prod.dim_junctions"
-        }
-        with engine.connect() as conn:
-            for table, query in dim_queries.items():
-                with st.spinner(f"Loading {table}..."):
-                    dim_tables[table] = pd.read_sql(query, con=conn.connection)
-
-        return fact_trips, dim_tables["dim_routes"], dim_tables["dim_junctions"]
+        aggregates = {}
+        for name, query in QUERIES.items():
+            aggregates[name] = cache.read_sql(query.format(where=where), params)
+
+        # Top 3 routes by trips, or the selected route
+        routes = aggregates['by_route'].nlargest(3, 'trip_count')['route'].astype(int).tolist()
+        aggregates['route_daily'] = cache.read_sql(
+            ROUTE_DAILY_QUERY.format(where=where),
+            {**params, 'routes': tuple(routes) or (None,)})
+        return process_data(aggregates)
 
     except Exception as e:
         logger.error(f"Data loading failed: {e}")
         st.error(f"Data loading error: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-    # finally:
-    #     engine.dispose()
-    #     logger.info("Database connections cleaned up")
-
-# Data Processing
-def process_data(fact_trips, dim_routes):
-    try:
-        # Convert datatypes
-        fact_trips['time'] = pd.to_datetime(
-            fact_trips['time'], format='%H:%M:%S', errors='coerce')
-        fact_trips['date'] = pd.to_datetime(
-            fact_trips['date'], errors='coerce')
-
-        # Extract temporal features
-        fact_trips['hour'] = fact_trips['time'].dt.hour
-        fact_trips['day_of_week'] = fact_trips['date'].dt.day_name()
-
-        # Merge with routes
-        if not dim_routes.empty:
-            fact_trips = fact_trips.merge(
-                dim_routes[['route', 'link', 'direction_name']
-                           ].drop_duplicates(),
-                on='route',
-                how='left'
-            )
-
-        # Memory optimization
-        for col in fact_trips.select_dtypes(include=['int64']):
-            fact_trips[col] = pd.to_numeric(
-                fact_trips[col], downcast='integer')
-        for col in fact_trips.select_dtypes(include=['object']):
-            fact_trips[col] = fact_trips[col].astype('category')
+        return {}
 
-        return fact_trips.dropna(subset=['date', 'time'])
+# Geometry is static between loads, so parse it once per process
+@st.cache_resource(show_spinner="Loading route geometry...")
+def load_geometry():
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        routes = pd.read_sql(
+            "SELECT route, link, direction, wkt FROM prod.dim_route_geometry", con=conn.connection)
+        junctions = pd.read_sql(
+            "SELECT junction_id, junction_name, x_coord, y_coord FROM prod.dim_junctions", con=conn.connection)
+    names = junctions.set_index('junction_id')['junction_name']
+    return RouteGeometry(routes), JunctionIndex.from_frame(junctions), names
 
-    except Exception as e:
-        logger.error(f"Data processing failed: {e}")
-        st.error("Failed to process data")
-        return pd.DataFrame()
-    finally:
-        gc.collect()  # Force garbage collection
-        # mem = psutil.Process().memory_info().rss / 1024 ** 2
-        # logger.info(f"Pre-visualization memory: {mem:.1f} MB")
+# Data Processing
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def process_data(aggregates):
+    """Typed copies of the loaded aggregates with weighted averages and calendar columns.
+
+    Called by load_data, so it runs once per cached result rather than on
+    every rerun. The input frames are left unchanged.
+    """
+    processed = {}
+    for name, df in aggregates.items():
+        df = df.copy()
+        if 'trip_count' in df.columns:
+            # DuckDB returns SUM over integers as float64
+            df['trip_count'] = df['trip_count'].fillna(0).astype(np.int64)
+        if 'sum_travel_time' in df.columns:
+            df['avg_travel_time'] = df['sum_travel_time'] / df['trip_count']
+        if 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        processed[name] = df
+
+    # Weekday from days since the epoch, a Thursday; Monday is code 0
+    by_date = processed['by_date']
+    days = by_date['date'].to_numpy(dtype='datetime64[D]')
+    codes = np.where(np.isnat(days), -1, (days.astype(np.int64) + 3) % 7)
+    by_date['day_of_week'] = pd.Categorical.from_codes(codes, categories=DAY_NAMES, ordered=True)
+    return processed
+
+# Travel time aggregates
+def travel_time_quantile(stt_histogram, q):
+    """Approximate q-quantile of travel time from agg_stt_histogram rows.
+
+    Returns the midpoint of the bucket holding the quantile, or None if there
+    are no trips.
+    """
+    buckets = stt_histogram.groupby(['stt_bucket_start', 'stt_bucket_end'])['trip_count'].sum().sort_index()
+    if buckets.sum() == 0:
+        return None
+    position = (buckets.cumsum() / buckets.sum()).searchsorted(q)
+    start, end = buckets.index[min(position, len(buckets) - 1)]
+    return (start + end) / 2
 
 # Visualization
 def safe_plotly_chart(fig):
@@ -130,25 +228,24 @@ def safe_plotly_chart(fig):
 
 # Main Application
 def main():
-    # Load data
-    fact_trips, dim_routes, dim_junctions = load_data()
+    data_version = refresh_local_cache()
+    try:
+        min_date, max_date, trip_types, routes = load_filter_options(data_version)
+    except duckdb.Error:
+        # Nothing cached yet and the warehouse could not be reached
+        min_date = None
 
     # Check data
-    if fact_trips.empty:
+    if pd.isna(min_date):
         st.error("No trip data available. Please try again later.")
         return
 
-    # Process data
-    with st.spinner("Processing data..."):
-        df = process_data(fact_trips, dim_routes)
-
     st.title("🚦 Dublin Traffic Travel Time Analytics")
 
     # Sidebar Filters
     st.sidebar.title("Filters")
 
     # Date range filter
-    min_date, max_date = df['date'].min(), df['date'].max()
     date_range = st.sidebar.date_input(
         "Date range",
         value=(min_date, max_date),
@@ -169,52 +266,57 @@ def main():
     # Other filters
     trip_type = st.sidebar.selectbox(
         "Trip Type",
-        ['All'] + sorted(df['trip_type'].dropna().unique().tolist())
+        ['All'] + trip_types
     )
 
     route = st.sidebar.selectbox(
         "Route",
-        ['All'] + sorted(df['route'].dropna().unique().tolist())
+        ['All'] + routes
     )
 
-    # Apply filters
-    filtered_df = df[
-        (df['date'].between(pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1]))) &
-        (df['hour'].between(time_range[0], time_range[1]))
-    ]
+    # Filters run in the database; a half-picked date range falls back to one day
+    if len(date_range) != 2:
+        date_range = (date_range[0], date_range[0])
+    aggregates = load_data(data_version, tuple(date_range), tuple(time_range), trip_type, route)
+    if not aggregates:
+        return
+    by_hour, by_route = aggregates['by_hour'], aggregates['by_route']
+    stt_histogram = aggregates['stt_histogram']
 
-    if trip_type != 'All':
-        filtered_df = filtered_df[filtered_df['trip_type'] == trip_type]
-    if route != 'All':
-        filtered_df = filtered_df[filtered_df['route'] == route]
+    if by_hour.empty:
+        st.warning("No trips match the current filters")
+        return
 
     # Display Metrics
     st.subheader("Performance Overview")
-    cols = st.columns(4)
-    cols[0].metric("Total Trips", f"{len(filtered_df):,}")
+    cols = st.columns(6)
+    total_trips = by_hour['trip_count'].sum()
+    cols[0].metric("Total Trips", f"{int(total_trips):,}")
     cols[1].metric("Avg Travel Time",
-                   f"{filtered_df['avg_travel_time'].mean():.1f} sec")
+                   f"{by_hour['sum_travel_time'].sum() / total_trips:.1f} sec")
     cols[2].metric(
-        "Peak Hour", f"{filtered_df.groupby('hour')['trip_count'].sum().idxmax()}:00")
+        "Peak Hour", f"{by_hour.loc[by_hour['trip_count'].idxmax(), 'hour']}:00")
     cols[3].metric("Busiest Route",
-                   f"Route {filtered_df['route'].value_counts().idxmax()}")
+                   f"Route {by_route.loc[by_route['trip_count'].idxmax(), 'route']}")
+    for col, (label, q) in zip(cols[4:], [("P50 Travel Time", 0.5), ("P95 Travel Time", 0.95)]):
+        quantile = travel_time_quantile(stt_histogram, q)
+        col.metric(label, f"{quantile:.0f} sec" if quantile is not None else "n/a")
 
     # Main Tabs
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "📈 Time Patterns",
         "🚏 Junctions",
         "🛣️ Route Analysis",
+        "🗺️ Map",
         "📊 Data"
     ])
 
     with tab1:
-        if not filtered_df.empty:
+        if not by_hour.empty:
             # 1. Avg Travel Time by Hour
             st.subheader("Average Travel Time by Hour of Day")
-            avg_time_by_hour = filtered_df.groupby(
-                'hour')['avg_travel_time'].mean().reset_index()
             fig1 = px.line(
-                avg_time_by_hour,
+                by_hour,
                 x='hour',
                 y='avg_travel_time',
                 markers=True,
@@ -226,10 +328,8 @@ def main():
 
             # 2. Peak Hour Analysis
             st.subheader("Peak Hour Analysis")
-            hourly_counts = filtered_df.groupby(
-                'hour')['trip_count'].sum().reset_index()
             fig2 = px.area(
-                hourly_counts,
+                by_hour,
                 x='hour',
                 y='trip_count',
                 title="Trip Volume by Hour",
@@ -239,9 +339,9 @@ def main():
 
             # 3. Trip Count by Day of Week
             st.subheader("Trip Count by Day of Week")
-            trips_by_day = filtered_df.groupby('day_of_week')['trip_count'].sum().reindex([
-                'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
-            ]).reset_index()
+            # day_of_week is an ordered categorical, so every weekday is listed in order
+            trips_by_day = aggregates['by_date'].groupby(
+                'day_of_week', observed=False)['trip_count'].sum().reset_index()
             fig3 = px.bar(
                 trips_by_day,
                 x='day_of_week',
@@ -253,46 +353,37 @@ def main():
             safe_plotly_chart(fig3)
 
             # 4. Travel Time Distribution
+            # Per-trip travel times from the precomputed histogram, not the
+            # distribution of per-group averages
             st.subheader("Travel Time Distribution")
-            if len(filtered_df) > 100000:  # Restricting data points to reduce load
-                sample_df = filtered_df.sample(100000)
-                fig4 = px.histogram(sample_df, x='avg_travel_time', nbins=50,
-                                    labels={'avg_travel_time': 'Travel Time (seconds)'})
-            else:
-                fig4 = px.histogram(filtered_df, x='avg_travel_time', nbins=50,
-                                    labels={'avg_travel_time': 'Travel Time (seconds)'})
+            fig4 = px.bar(stt_histogram, x='stt_bucket_start', y='trip_count',
+                          labels={'stt_bucket_start': 'Travel Time (seconds)',
+                                  'trip_count': 'Number of Trips'})
             safe_plotly_chart(fig4)
 
     with tab2:
         # 1. Junction Pair Analysis
         st.subheader("Common Junction Pairs")
-        if 'junction_start' in filtered_df.columns and 'junction_end' in filtered_df.columns:
-            junction_pairs = filtered_df.groupby(
-                ['junction_start', 'junction_end']).size().reset_index(name='count')
-            junction_pairs = junction_pairs.sort_values(
-                'count', ascending=False).head(10)
-            fig9 = px.bar(junction_pairs, x='count', y='junction_start', color='junction_end',
-                          labels={'count': 'Number of Trips',
+        junction_pairs = aggregates['junction_pairs']
+        if not junction_pairs.empty:
+            fig9 = px.bar(junction_pairs, x='trip_count', y='junction_start', color='junction_end',
+                          labels={'trip_count': 'Number of Trips',
                                   'junction_start': 'Start Junction'},
                           orientation='h')
             safe_plotly_chart(fig9)
 
         # 2. Top Start Junctions
         st.subheader("Top 10 Start Junctions by Trip Count")
-        if 'junction_start' in filtered_df.columns:
-            top_starts = filtered_df['junction_start'].value_counts().head(
-                10).reset_index()
-            top_starts.columns = ['junction_start', 'trip_count']
+        top_starts = aggregates['start_junctions']
+        if not top_starts.empty:
             fig7 = px.bar(top_starts, x='junction_start', y='trip_count',
                           labels={'trip_count': 'Number of Trips', 'junction_start': 'Start Junction'})
             safe_plotly_chart(fig7)
 
         # 3. Top End Junctions
         st.subheader("Top 10 End Junctions by Trip Count")
-        if 'junction_end' in filtered_df.columns:
-            top_ends = filtered_df['junction_end'].value_counts().head(
-                10).reset_index()
-            top_ends.columns = ['junction_end', 'trip_count']
+        top_ends = aggregates['end_junctions']
+        if not top_ends.empty:
             fig8 = px.bar(top_ends, x='junction_end', y='trip_count',
                           labels={'trip_count': 'Number of Trips', 'junction_end': 'End Junction'})
             safe_plotly_chart(fig8)
@@ -300,10 +391,7 @@ def main():
     with tab3:
         # 1. Top Routes by Travel Time
         st.subheader("Top 10 Routes by Average Travel Time")
-        route_stats = filtered_df.groupby('route').agg({
-            'avg_travel_time': 'mean',
-            'trip_count': 'sum'
-        }).reset_index()
+        route_stats = by_route
 
         if not route_stats.empty:
             top_routes = route_stats.sort_values(
@@ -335,15 +423,12 @@ def main():
 
         # 2. Route Performance Over Time
         st.subheader("Route Performance Over Time")
-        if not filtered_df.empty:
+        route_daily = aggregates['route_daily']
+        if not route_daily.empty:
             if route == 'All':
-                # Show top 3 routes if no specific route selected
-                top_routes = filtered_df['route'].value_counts().head(
-                    3).index.tolist()
-                route_data = filtered_df[filtered_df['route'].isin(top_routes)]
+                # load_data picked the top 3 routes by trip count
                 fig5 = px.line(
-                    route_data.groupby(['date', 'route'])[
-                        'avg_travel_time'].mean().reset_index(),
+                    route_daily,
                     x='date',
                     y='avg_travel_time',
                     color='route',
@@ -355,10 +440,8 @@ def main():
                 )
             else:
                 # Show selected route's performance
-                route_data = filtered_df[filtered_df['route'] == route]
                 fig5 = px.line(
-                    route_data.groupby('date')[
-                        'avg_travel_time'].mean().reset_index(),
+                    route_daily,
                     x='date',
                     y='avg_travel_time',
                     title=f"Daily Performance for Route {route}",
@@ -373,12 +456,54 @@ def main():
                 "No route performance data available with current filters")
 
     with tab4:
-        st.subheader("Filtered Data Preview")
-        st.dataframe(filtered_df.head(100))
+        st.subheader("Route Map")
+        try:
+            routes_geometry, junction_index, junction_names = load_geometry()
+        except Exception as e:
+            # Geometry is read from Redshift, not the local cache; keep the rest of the page up
+            logger.warning(f"Route geometry unavailable: {e}")
+            st.warning("Route geometry is unavailable while the warehouse cannot be reached")
+            routes_geometry = None
+
+        if routes_geometry is not None:
+            mask = routes_geometry.keys[:, 0] == route if route != 'All' else None
+            x, y = routes_geometry.path_arrays(mask)
+
+            if np.isnan(x).all():
+                st.warning("No route geometry available for the selected route")
+            else:
+                # Junctions inside the drawn links' bounding box, padded by 500 m
+                bbox = (np.nanmin(x) - 500, np.nanmin(y) - 500, np.nanmax(x) + 500, np.nanmax(y) + 500)
+                inside = np.isin(junction_index.ids, junction_index.within_bbox(*bbox))
+                junction_ids, points = junction_index.ids[inside], junction_index.xy[inside]
+                fig10 = go.Figure([
+                    go.Scattergl(x=x, y=y, mode='lines', name='Links', line={'width': 2}),
+                    go.Scattergl(x=points[:, 0], y=points[:, 1], mode='markers', name='Junctions',
+                                 text=junction_names.reindex(junction_ids).tolist(), hoverinfo='text'),
+                ])
+                fig10.update_layout(yaxis={'scaleanchor': 'x'}, xaxis_title="Easting (m)",
+                                    yaxis_title="Northing (m)")
+                safe_plotly_chart(fig10)
+
+                if route != 'All':
+                    selected = np.flatnonzero(mask)
+                    st.dataframe(pd.DataFrame({
+                        'link': routes_geometry.keys[selected, 1],
+                        'direction': routes_geometry.keys[selected, 2],
+                        'length_m': routes_geometry.lengths[selected].round(0),
+                        'nearest_start_junction': [
+                            junction_names.get(junction_index.nearest(*routes_geometry.link_coords(i)[0])[0])
+                            for i in selected
+                        ],
+                    }))
+
+    with tab5:
+        st.subheader("Route Summary for Current Filters")
+        st.dataframe(by_route.sort_values('trip_count', ascending=False))
 
         st.download_button(
-            "Download Filtered Data",
-            data=filtered_df.to_csv(index=False).encode('utf-8'),
+            "Download Route Summary",
+            data=by_route.to_csv(index=False).encode('utf-8'),
             file_name=f"dublin_traffic_{datetime.now().date()}.csv",
             mime='text/csv'
         )
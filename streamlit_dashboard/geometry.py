@@ -0,0 +1,180 @@
+"""Route and junction geometry as NumPy arrays, with a grid index over junctions.
+
+Coordinates are Irish Grid eastings/northings in metres, as found in the
+TRIPS routes WKT and the junctions X/Y columns, so distances and lengths
+come out in metres.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def parse_linestrings(wkt):
+    """Parse a Series of LINESTRING WKT into flat coordinate arrays.
+
+    Accepts both standard WKT and the TRIPS export form that writes point
+    separators as the token "comma", e.g.
+    ``LINESTRING(321909 228333 comma 321106 228863)``. Blank points, found on
+    links to junctions without a location, become NaN.
+
+    :param wkt: Series of WKT strings, one per link
+    :return: (coords, offsets) where coords is a float64 array of shape
+             (n_points, 2) and link i spans coords[offsets[i]:offsets[i + 1]]
+    """
+    inner = (wkt.reset_index(drop=True).fillna("").str.replace(" comma ", ",", regex=False)
+             .str.replace(r"^\s*LINESTRING\s*\(|\)\s*$", "", regex=True))
+    points = inner.str.split(",").explode()
+    xy = points.str.strip().str.split(r"\s+", n=1, expand=True).reindex(columns=[0, 1])
+    coords = np.column_stack([
+        pd.to_numeric(xy[0], errors="coerce").to_numpy(dtype=np.float64),
+        pd.to_numeric(xy[1], errors="coerce").to_numpy(dtype=np.float64),
+    ])
+    counts = points.groupby(level=0, sort=False).size().to_numpy()
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return coords, offsets
+
+
+def link_lengths(coords, offsets):
+    """Length of every link as the sum of its segment lengths.
+
+    Links with any missing point get NaN.
+    """
+    segments = np.hypot(*np.diff(coords, axis=0).T)
+    # Drop the segments that join the last point of one link to the next link
+    cumulative = np.concatenate([[0.0], np.cumsum(np.nan_to_num(segments))])
+    ends = np.maximum(offsets[1:] - 1, offsets[:-1])
+    lengths = cumulative[ends] - cumulative[offsets[:-1]]
+    missing = np.isnan(coords).any(axis=1)
+    has_missing = np.add.reduceat(missing, offsets[:-1]) > 0 if len(coords) else np.zeros(0, bool)
+    return np.where(has_missing, np.nan, lengths)
+
+
+class RouteGeometry:
+    """Parsed geometry of every (route, link, direction).
+
+    :param routes: DataFrame with route, link, direction and wkt columns
+    """
+
+    def __init__(self, routes):
+        self.keys = routes[["route", "link", "direction"]].to_numpy(dtype=np.int32)
+        self.coords, self.offsets = parse_linestrings(routes["wkt"])
+        self.lengths = link_lengths(self.coords, self.offsets)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def link_coords(self, i):
+        """Points of link i as an (n, 2) array view."""
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def path_arrays(self, mask=None):
+        """x and y arrays of the selected links, NaN-separated for one line trace."""
+        selected = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        gap = np.full((1, 2), np.nan)
+        parts = [part for i in selected for part in (self.link_coords(i), gap)]
+        path = np.concatenate(parts) if parts else np.empty((0, 2))
+        return path[:, 0], path[:, 1]
+
+
+class JunctionIndex:
+    """Uniform grid over junction coordinates for nearest and bounding-box queries.
+
+    Points are sorted by grid cell so each cell is a contiguous slice; a
+    query only looks at the cells it overlaps.
+
+    :param ids: Junction ids
+    :param xy: (n, 2) array of junction coordinates; rows with NaN are dropped
+    :param cell_size: Grid cell edge in coordinate units (metres)
+    """
+
+    def __init__(self, ids, xy, cell_size=500.0):
+        ids = np.asarray(ids)
+        xy = np.asarray(xy, dtype=np.float64)
+        keep = ~np.isnan(xy).any(axis=1)
+        ids, xy = ids[keep], xy[keep]
+
+        self.cell_size = float(cell_size)
+        self.origin = xy.min(axis=0) if len(xy) else np.zeros(2)
+        cells = self._cells(xy)
+        self.shape = cells.max(axis=0) + 1 if len(xy) else np.ones(2, dtype=np.int64)
+
+        flat = cells[:, 0] * self.shape[1] + cells[:, 1]
+        order = np.argsort(flat, kind="stable")
+        self.ids, self.xy = ids[order], xy[order]
+        self.cell_start = np.searchsorted(flat[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    @classmethod
+    def from_frame(cls, junctions, cell_size=500.0):
+        """Build from a DataFrame with junction_id, x_coord and y_coord columns."""
+        xy = junctions[["x_coord", "y_coord"]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        return cls(junctions["junction_id"].to_numpy(), xy, cell_size)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cells(self, xy):
+        return np.floor((xy - self.origin) / self.cell_size).astype(np.int64)
+
+    def _points_in_cells(self, lo, hi):
+        """Indices of points in grid cells lo..hi (inclusive, clipped to the grid)."""
+        lo = np.clip(lo, 0, self.shape - 1)
+        hi = np.clip(hi, 0, self.shape - 1)
+        rows = np.arange(lo[0], hi[0] + 1)
+        starts = self.cell_start[rows * self.shape[1] + lo[1]]
+        stops = self.cell_start[rows * self.shape[1] + hi[1] + 1]
+        if not len(starts):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+
+    def within_bbox(self, xmin, ymin, xmax, ymax):
+        """Ids of junctions inside the bounding box (edges included)."""
+        if not len(self):
+            return self.ids[:0]
+        lo = self._cells(np.array([xmin, ymin]))
+        hi = self._cells(np.array([xmax, ymax]))
+        if (hi < 0).any() or (lo >= self.shape).any():
+            return self.ids[:0]
+        candidates = self._points_in_cells(lo, hi)
+        x, y = self.xy[candidates].T
+        inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        return self.ids[candidates[inside]]
+
+    def nearest(self, x, y):
+        """Nearest junction to (x, y) as (junction_id, distance).
+
+        Searches rings of cells around the query cell, stopping once the ring
+        is further away than the best match found so far. Returns (None, inf)
+        for an empty index or a NaN query point.
+        """
+        point = np.array([x, y], dtype=np.float64)
+        if not len(self) or np.isnan(point).any():
+            return None, np.inf
+        center = self._cells(point)
+        # Rings needed to cover the whole grid from the query cell
+        max_ring = int(np.max(np.maximum(np.abs(center), np.abs(self.shape - 1 - center))))
+        best, best_distance = None, np.inf
+        for ring in range(max_ring + 1):
+            # Every point outside rings 0..ring-1 is at least this far away
+            if (ring - 1) * self.cell_size >= best_distance:
+                break
+            candidates = self._ring_points(center, ring)
+            if len(candidates):
+                distances = np.hypot(*(self.xy[candidates] - point).T)
+                i = np.argmin(distances)
+                if distances[i] < best_distance:
+                    best, best_distance = candidates[i], distances[i]
+        return self.ids[best], float(best_distance)
+
+    def _ring_points(self, center, ring):
+        """Indices of points in the square ring of cells at Chebyshev distance ``ring``."""
+        if ring == 0:
+            return self._points_in_cells(center, center)
+        lo, hi = center - ring, center + ring
+        parts = [
+            self._points_in_cells(lo, np.array([lo[0], hi[1]])) if lo[0] >= 0 else None,
+            self._points_in_cells(np.array([hi[0], lo[1]]), hi) if hi[0] < self.shape[0] else None,
+            self._points_in_cells(np.array([lo[0] + 1, lo[1]]), np.array([hi[0] - 1, lo[1]])) if lo[1] >= 0 else None,
+            self._points_in_cells(np.array([lo[0] + 1, hi[1]]), np.array([hi[0] - 1, hi[1]])) if hi[1] < self.shape[1] else None,
+        ]
+        parts = [part for part in parts if part is not None]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
@@ -0,0 +1,351 @@
+"""Local Parquet mirror of the warehouse marts the dashboard reads, queried with DuckDB.
+
+Every mirrored table is stored as Hive-style date partitions,
+``{cache_dir}/{table}/date=YYYY-MM-DD/part-0.parquet``. refresh() re-fetches
+only the days from the local max(date) watermark back by LOOKBACK_DAYS, the
+window the incremental dbt models may still rewrite, so a refresh costs one
+query per changed day. DuckDB prunes partitions on the "date" filter, so a
+query reads only the days it asks for.
+
+Each table directory also holds ``_build.json``, the warehouse table's oid and
+columns when it was mirrored. A dbt --full-refresh recreates the table (new
+oid) and a schema change alters its columns; either way the table is fetched
+again in full into a new directory that replaces the old one.
+
+refresh() accepts an ADBC PostgreSQL connection, which streams results as
+Arrow record batches, or any psycopg2 connection.
+"""
+
+import datetime
+import glob
+import json
+import numbers
+import os
+import re
+import shutil
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CACHE_DIR = os.getenv("DASHBOARD_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+
+# Days before the local watermark re-fetched on every refresh; keep it at
+# least the dbt fact_trips_lookback_days so late rows reach the cache
+LOOKBACK_DAYS = int(os.getenv("DASHBOARD_CACHE_LOOKBACK_DAYS", "3"))
+
+# Warehouse schema and the date-keyed tables mirrored from it
+SCHEMA = "prod"
+TABLES = ["agg_trips_hourly", "agg_trips_route_day", "agg_stt_histogram", "agg_trips_junction_pair"]
+
+# Rows fetched per round trip during a refresh, and the memory the fetched
+# rows of one day may hold (measured with memory_usage(deep=True)) before
+# they are written out as a Parquet row group
+FETCH_CHUNK_ROWS = int(os.getenv("DASHBOARD_CACHE_CHUNK_ROWS", "100000"))
+MEMORY_BUDGET_MB = int(os.getenv("DASHBOARD_CACHE_MEMORY_MB", "700"))
+
+# Parquet type of each information_schema data_type found in the marts;
+# anything else is stored as text
+ARROW_TYPES = {
+    "smallint": pa.int64(),
+    "integer": pa.int64(),
+    "bigint": pa.int64(),
+    "real": pa.float64(),
+    "double precision": pa.float64(),
+    "numeric": pa.float64(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "time without time zone": pa.time64("us"),
+    "timestamp without time zone": pa.timestamp("us"),
+}
+
+
+def to_duckdb_query(query, params):
+    """Rewrite a psycopg2 pyformat query for DuckDB's $name parameters.
+
+    Tuple values, used with ``IN %(name)s``, are expanded into one parameter
+    per element the way psycopg2 adapts them.
+    """
+    params = params or {}
+    bound = {}
+
+    def replace(match):
+        name = match.group(1)
+        value = params[name]
+        if isinstance(value, tuple):
+            names = [f"{name}_{i}" for i in range(len(value))]
+            bound.update(zip(names, value))
+            return "(" + ", ".join(f"${n}" for n in names) + ")"
+        bound[name] = value
+        return f"${name}"
+
+    return re.sub(r"%\((\w+)\)s", replace, query), bound
+
+
+def to_literal_query(query, params):
+    """Inline the dates and numbers of a pyformat query as SQL literals.
+
+    ADBC's PostgreSQL driver streams a result in batches (over binary COPY)
+    only for queries without bound parameters, and fetches a bound query
+    whole. Only values with an unambiguous literal form are accepted.
+    """
+    def replace(match):
+        value = params[match.group(1)]
+        if isinstance(value, datetime.date):
+            return f"'{value.isoformat()}'"
+        if isinstance(value, numbers.Real) and not isinstance(value, bool):
+            return str(value)
+        raise TypeError(f"Cannot inline parameter {match.group(1)!r} of type {type(value).__name__}")
+
+    return re.sub(r"%\((\w+)\)s", replace, query)
+
+
+def shrink_frame(frame):
+    """Downcast integer columns and turn repetitive string columns into categoricals.
+
+    Floats are left alone: travel time sums would lose precision as float32.
+    """
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_integer_dtype(series):
+            frame[column] = pd.to_numeric(series, downcast="integer")
+        elif (pd.api.types.is_string_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype)
+              and series.nunique() < len(series) / 2):
+            frame[column] = series.astype("category")
+    return frame
+
+
+def iter_sql_chunks(conn, query, params, chunksize=None):
+    """Yield query results as shrunk DataFrames.
+
+    An ADBC connection streams the result as Arrow record batches sized by
+    the driver, with params inlined by to_literal_query. Each batch becomes a
+    DataFrame of pyarrow-backed columns, so no Python object is made per row,
+    not even for date and time values.
+
+    Other connections are read through a psycopg2 server-side cursor,
+    chunksize rows at a time, so only one chunk is held on the client;
+    pd.read_sql(chunksize=...) on a plain DB-API cursor still receives the
+    whole result first.
+    """
+    if hasattr(conn, "adbc_connection"):
+        with conn.cursor() as cur:
+            cur.execute(to_literal_query(query, params))
+            for batch in cur.fetch_record_batch():
+                yield shrink_frame(batch.to_pandas(types_mapper=pd.ArrowDtype))
+        return
+
+    chunksize = chunksize or FETCH_CHUNK_ROWS
+    with conn.cursor(name="local_cache_refresh") as cur:
+        cur.itersize = chunksize
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows:
+                break
+            columns = [column[0] for column in cur.description]
+            yield shrink_frame(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+
+
+def arrow_schema(columns):
+    """Partition schema for warehouse (name, data_type) columns, without "date".
+
+    Taken from the warehouse rather than the fetched rows, so a column that is
+    all NULL on some day still gets its real type.
+    """
+    return pa.schema([(name, ARROW_TYPES.get(data_type, pa.string()))
+                      for name, data_type in columns if name != "date"])
+
+
+def day_totals(chunks):
+    """Map each day of ("date", row_count, total) chunks to (row_count, total)."""
+    return {pd.Timestamp(row.date).date(): (int(row.row_count), None if pd.isna(row.total) else int(row.total))
+            for chunk in chunks for row in chunk.itertuples(index=False)}
+
+
+class LocalCache:
+    """Date-partitioned Parquet copies of warehouse tables behind DuckDB views.
+
+    :param cache_dir: Directory holding one sub-directory per table
+    :param tables: Warehouse tables to mirror; each needs a "date" column
+    :param schema: Warehouse schema of the tables, reused for the DuckDB views
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, tables=TABLES, schema=SCHEMA):
+        self.cache_dir = cache_dir
+        self.tables = list(tables)
+        self.schema = schema
+        # In-memory catalogue only; the data stays in the Parquet files
+        self.db = duckdb.connect()
+        self.db.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        self._create_views()
+
+    def partitions(self, table):
+        """Sorted dates with a local partition for table."""
+        paths = glob.glob(os.path.join(self.cache_dir, table, "date=*", "part-0.parquet"))
+        return sorted(datetime.date.fromisoformat(os.path.basename(os.path.dirname(path))[len("date="):])
+                      for path in paths)
+
+    def version(self):
+        """Changes whenever a partition is written; use it to key result caches."""
+        paths = glob.glob(os.path.join(self.cache_dir, "*", "date=*", "part-0.parquet"))
+        return max((os.stat(path).st_mtime_ns for path in paths), default=0)
+
+    def refresh(self, conn):
+        """Fetch new days, and changed days among the last LOOKBACK_DAYS before the watermark.
+
+        Tables whose warehouse build no longer matches the cached one are
+        fetched again in full.
+
+        :param conn: ADBC or psycopg2 connection to the warehouse
+        :return: dict of table name to number of partitions written
+        """
+        written = {}
+        for table in self.tables:
+            build = self._warehouse_build(conn, table)
+            directory = os.path.join(self.cache_dir, table)
+            if build == self._cached_build(table):
+                local = self.partitions(table)
+                since = local[-1] - datetime.timedelta(days=LOOKBACK_DAYS) if local else datetime.date.min
+                written[table] = self._fetch_days(conn, table, since, directory, build)
+            else:
+                rebuild = f"{directory}.rebuild"
+                shutil.rmtree(rebuild, ignore_errors=True)
+                written[table] = self._fetch_days(conn, table, datetime.date.min, rebuild, build)
+                with open(os.path.join(rebuild, "_build.json"), "w") as f:
+                    json.dump(build, f)
+                self._replace_directory(rebuild, directory)
+            # Close the transaction the reads ran in
+            conn.rollback()
+        if any(written.values()):
+            self._create_views()
+        return written
+
+    def read_sql(self, query, params=None):
+        """Run a warehouse-style query (pyformat parameters) against the cache."""
+        query, bound = to_duckdb_query(query, params)
+        # A cursor per query lets Streamlit sessions query from their own threads
+        with self.db.cursor() as cur:
+            return cur.execute(query, bound).df()
+
+    def _warehouse_build(self, conn, table):
+        """Oid and (name, data_type) columns of the warehouse table."""
+        # Read to the end so the server-side cursor is closed before the next query
+        oids = list(iter_sql_chunks(conn, f"""
+            SELECT c.oid::bigint AS oid FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = '{self.schema}' AND c.relname = '{table}'""", {}))
+        if not oids:
+            raise ValueError(f"{self.schema}.{table} not found in the warehouse")
+        columns = pd.concat(list(iter_sql_chunks(conn, f"""
+            SELECT column_name::varchar AS name, data_type::varchar AS data_type
+            FROM information_schema.columns
+            WHERE table_schema = '{self.schema}' AND table_name = '{table}'
+            ORDER BY ordinal_position""", {})))
+        return {"oid": int(oids[0]["oid"].iloc[0]),
+                "columns": columns[["name", "data_type"]].astype(str).values.tolist()}
+
+    def _cached_build(self, table):
+        path = os.path.join(self.cache_dir, table, "_build.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _fetch_days(self, conn, table, since, directory, build):
+        """Write a partition under directory for every changed day of table from since on.
+
+        A day is unchanged, and its partition left alone, when its row count
+        and trip_count total match the partition already under directory, so
+        a refresh that finds nothing new does not move version().
+
+        :return: number of partitions written
+        """
+        schema = arrow_schema(build["columns"])
+        measure = "SUM(trip_count)::bigint" if "trip_count" in schema.names else "NULL::bigint"
+        remote = day_totals(iter_sql_chunks(
+            conn, f'SELECT "date", COUNT(*) AS row_count, {measure} AS total '
+                  f'FROM {self.schema}.{table} WHERE "date" >= %(since)s GROUP BY 1',
+            {"since": since}))
+        local = self._local_day_totals(directory, since, measure)
+        days = sorted(day for day, totals in remote.items() if local.get(day) != totals)
+        for day in days:
+            chunks = iter_sql_chunks(conn, f'SELECT * FROM {self.schema}.{table} WHERE "date" = %(day)s',
+                                     {"day": day})
+            self._write_partition(directory, day, schema, (chunk.drop(columns=["date"]) for chunk in chunks))
+        return len(days)
+
+    def _local_day_totals(self, directory, since, measure):
+        """day_totals of the partitions under directory from since on."""
+        files = os.path.join(directory, "date=*", "part-0.parquet")
+        if not glob.glob(files):
+            return {}
+        with self.db.cursor() as cur:
+            frame = cur.execute(f"""
+                SELECT "date", COUNT(*) AS row_count, {measure} AS total
+                FROM read_parquet('{files}', hive_partitioning = true, hive_types = {{'date': DATE}})
+                WHERE "date" >= $since GROUP BY 1""", {"since": since}).df()
+        return day_totals([frame])
+
+    @staticmethod
+    def _replace_directory(new, directory):
+        """Move new into place of directory, which is removed."""
+        old = f"{directory}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(new, directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _write_partition(self, table_dir, day, schema, chunks):
+        """Atomically replace one day under table_dir with the rows in chunks.
+
+        Chunks are buffered until they exceed MEMORY_BUDGET_MB and then
+        written as one row group, so a day larger than the budget is spilled
+        to the file in pieces instead of being held in memory whole.
+        """
+        directory = os.path.join(table_dir, f"date={day.isoformat()}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "part-0.parquet")
+
+        writer = None
+        buffered, buffered_bytes = [], 0
+        budget = MEMORY_BUDGET_MB * 1024 * 1024
+        try:
+            for chunk in chunks:
+                buffered.append(chunk)
+                buffered_bytes += chunk.memory_usage(deep=True).sum()
+                if buffered_bytes > budget:
+                    writer = self._write_row_group(writer, f"{path}.tmp", schema, buffered)
+                    buffered, buffered_bytes = [], 0
+            if buffered or writer is None:
+                writer = self._write_row_group(writer, f"{path}.tmp", schema, buffered)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _write_row_group(writer, path, schema, frames):
+        """Write frames as one row group, opening the writer on first use."""
+        if writer is None:
+            writer = pq.ParquetWriter(path, schema)
+        if frames:
+            frame = pd.concat(frames, ignore_index=True)
+            data = pa.Table.from_pandas(frame, preserve_index=False)
+            writer.write_table(data.select(schema.names).cast(schema))
+        else:
+            writer.write_table(schema.empty_table())
+        return writer
+
+    def _create_views(self):
+        for table in self.tables:
+            if not self.partitions(table):
+                self.db.execute(f"DROP VIEW IF EXISTS {self.schema}.{table}")
+                continue
+            files = os.path.join(self.cache_dir, table, "date=*", "part-0.parquet")
+            self.db.execute(f"""
+                CREATE OR REPLACE VIEW {self.schema}.{table} AS
+                SELECT * FROM read_parquet('{files}', hive_partitioning = true,
+                                           hive_types = {{'date': DATE}})
+            """)
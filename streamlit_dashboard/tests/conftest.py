@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The dashboard runs from streamlit_dashboard/; mirror that for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
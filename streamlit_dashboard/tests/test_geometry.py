@@ -0,0 +1,76 @@
+"""Tests for WKT parsing and the junction grid index."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import geometry
+
+ROUTES = pd.DataFrame({
+    "route": [1, 1, 29],
+    "link": [1, 1, 3],
+    "direction": [1, 2, 1],
+    "wkt": [
+        "LINESTRING(321909 228333 comma 321106 228863)",
+        "LINESTRING(0 0, 3 4, 3 10)",
+        "LINESTRING(317203 233928 comma  )",
+    ],
+})
+
+
+def test_parse_linestrings_handles_comma_token_and_blank_points():
+    coords, offsets = geometry.parse_linestrings(ROUTES["wkt"])
+
+    assert offsets.tolist() == [0, 2, 5, 7]
+    assert coords[:2].tolist() == [[321909, 228333], [321106, 228863]]
+    assert coords[2:5].tolist() == [[0, 0], [3, 4], [3, 10]]
+    assert np.isnan(coords[6]).all()
+
+
+def test_route_geometry_link_lengths():
+    routes = geometry.RouteGeometry(ROUTES)
+
+    assert routes.lengths[0] == pytest.approx(np.hypot(803, 530))
+    assert routes.lengths[1] == pytest.approx(11.0)
+    assert np.isnan(routes.lengths[2])
+    x, y = routes.path_arrays(routes.keys[:, 0] == 1)
+    assert len(x) == 7 and np.isnan(x[2]) and np.isnan(x[6])
+
+
+@pytest.fixture
+def junctions():
+    rng = np.random.default_rng(0)
+    xy = rng.uniform([310000, 225000], [330000, 240000], size=(500, 2))
+    xy[:5] = np.nan
+    return np.arange(500), xy
+
+
+def test_nearest_matches_brute_force(junctions):
+    ids, xy = junctions
+    index = geometry.JunctionIndex(ids, xy, cell_size=750)
+    valid = ~np.isnan(xy).any(axis=1)
+    rng = np.random.default_rng(1)
+
+    for query in rng.uniform([300000, 215000], [340000, 250000], size=(200, 2)):
+        junction_id, distance = index.nearest(*query)
+        distances = np.hypot(*(xy[valid] - query).T)
+        assert distance == pytest.approx(distances.min())
+        assert junction_id == ids[valid][np.argmin(distances)]
+
+
+def test_within_bbox_matches_brute_force(junctions):
+    ids, xy = junctions
+    index = geometry.JunctionIndex(ids, xy, cell_size=750)
+    x, y = xy.T
+
+    inside = (x >= 315000) & (x <= 318000) & (y >= 230000) & (y <= 236000)
+    assert sorted(index.within_bbox(315000, 230000, 318000, 236000)) == sorted(ids[inside])
+    assert len(index.within_bbox(0, 0, 10, 10)) == 0
+
+
+def test_index_from_frame_skips_junctions_without_coordinates():
+    frame = pd.DataFrame({"junction_id": [1, 2], "x_coord": [316067, None], "y_coord": [234568, None]})
+    index = geometry.JunctionIndex.from_frame(frame)
+
+    assert len(index) == 1
+    assert index.nearest(316000, 234500)[0] == 1
@@ -0,0 +1,178 @@
+"""Tests for the DuckDB/Parquet cache, refreshed from a local Postgres (pgserver)."""
+
+import datetime
+
+import pandas as pd
+import pytest
+
+import local_cache
+
+DAY = datetime.date(2015, 11, 19)
+
+
+@pytest.fixture
+def warehouse_server(tmp_path):
+    pgserver = pytest.importorskip("pgserver")
+    psycopg2 = pytest.importorskip("psycopg2")
+
+    server = pgserver.get_server(str(tmp_path / "pgdata"), cleanup_mode="stop")
+    with psycopg2.connect(server.get_uri()) as conn, conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA prod;")
+        cur.execute('CREATE TABLE prod.fact_trips ("date" date, route int, trip_count int, sum_travel_time float);')
+        cur.execute("INSERT INTO prod.fact_trips VALUES (%s, 1, 2, 100.0), (%s, 2, 1, 40.0), (%s, 1, 3, 90.0);",
+                    (DAY, DAY, DAY + datetime.timedelta(days=1)))
+    conn.close()
+    yield server
+    server.cleanup()
+
+
+@pytest.fixture
+def warehouse(warehouse_server):
+    psycopg2 = pytest.importorskip("psycopg2")
+    # refresh() reads through server-side cursors, which need a transaction
+    conn = psycopg2.connect(warehouse_server.get_uri())
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return local_cache.LocalCache(str(tmp_path / "cache"), tables=["fact_trips"])
+
+
+def test_refresh_mirrors_tables_as_date_partitions(warehouse, cache):
+    assert cache.refresh(warehouse) == {"fact_trips": 2}
+
+    assert cache.partitions("fact_trips") == [DAY, DAY + datetime.timedelta(days=1)]
+    result = cache.read_sql(
+        'SELECT route, SUM(trip_count) AS trips FROM prod.fact_trips '
+        'WHERE "date" BETWEEN %(start)s AND %(end)s AND route IN %(routes)s GROUP BY route ORDER BY route',
+        {"start": DAY, "end": DAY, "routes": (1, 2)})
+    assert result.to_dict("list") == {"route": [1, 2], "trips": [2, 1]}
+
+
+def test_refresh_only_refetches_from_the_watermark(warehouse, cache, monkeypatch):
+    monkeypatch.setattr(local_cache, "LOOKBACK_DAYS", 0)
+    cache.refresh(warehouse)
+    version = cache.version()
+
+    with warehouse.cursor() as cur:
+        cur.execute("INSERT INTO prod.fact_trips VALUES (%s, 1, 5, 50.0);", (DAY + datetime.timedelta(days=2),))
+    warehouse.commit()
+    # The watermark day is compared again but unchanged, so only the new day is written
+    assert cache.refresh(warehouse) == {"fact_trips": 1}
+    assert len(cache.partitions("fact_trips")) == 3
+    assert cache.version() > version
+    assert cache.read_sql("SELECT SUM(trip_count) AS trips FROM prod.fact_trips")["trips"][0] == 11
+
+
+def test_refresh_leaves_unchanged_days_alone(warehouse, cache):
+    cache.refresh(warehouse)
+    version = cache.version()
+
+    assert cache.refresh(warehouse) == {"fact_trips": 0}
+    assert cache.version() == version
+
+    with warehouse.cursor() as cur:
+        cur.execute('UPDATE prod.fact_trips SET trip_count = trip_count + 1 WHERE "date" = %s AND route = 2;', (DAY,))
+    warehouse.commit()
+    assert cache.refresh(warehouse) == {"fact_trips": 1}
+    assert cache.version() > version
+    assert cache.read_sql("SELECT SUM(trip_count) AS trips FROM prod.fact_trips")["trips"][0] == 7
+
+
+def test_refresh_rebuilds_a_table_whose_columns_changed(warehouse, cache):
+    cache.refresh(warehouse)
+    with warehouse.cursor() as cur:
+        cur.execute("ALTER TABLE prod.fact_trips ADD COLUMN trip_type varchar;")
+        cur.execute("INSERT INTO prod.fact_trips VALUES (%s, 3, 1, 10.0, 'Normal');", (DAY,))
+    warehouse.commit()
+
+    assert cache.refresh(warehouse) == {"fact_trips": 2}
+    result = cache.read_sql('SELECT route, trip_type FROM prod.fact_trips ORDER BY "date", route')
+    assert result["trip_type"].fillna("").tolist()[:3] == ["", "", "Normal"]
+
+
+def test_refresh_rebuilds_days_outside_the_lookback_after_a_full_refresh(warehouse, cache, monkeypatch):
+    monkeypatch.setattr(local_cache, "LOOKBACK_DAYS", 0)
+    cache.refresh(warehouse)
+    # dbt --full-refresh recreates the table, here with corrected history
+    with warehouse.cursor() as cur:
+        cur.execute("CREATE TABLE prod.fact_trips_new AS SELECT \"date\", route, trip_count * 10 AS trip_count, "
+                    "sum_travel_time FROM prod.fact_trips;")
+        cur.execute("DROP TABLE prod.fact_trips;")
+        cur.execute("ALTER TABLE prod.fact_trips_new RENAME TO fact_trips;")
+    warehouse.commit()
+
+    cache.refresh(warehouse)
+    assert cache.read_sql("SELECT SUM(trip_count) AS trips FROM prod.fact_trips")["trips"][0] == 60
+
+
+def test_refresh_types_all_null_columns_from_the_warehouse(warehouse, cache):
+    with warehouse.cursor() as cur:
+        cur.execute("ALTER TABLE prod.fact_trips ADD COLUMN trip_type varchar;")
+    warehouse.commit()
+    cache.refresh(warehouse)
+
+    with warehouse.cursor() as cur:
+        cur.execute("INSERT INTO prod.fact_trips VALUES (%s, 1, 1, 5.0, 'Long');", (DAY + datetime.timedelta(days=2),))
+    warehouse.commit()
+    cache.refresh(warehouse)
+
+    result = cache.read_sql("SELECT trip_type FROM prod.fact_trips WHERE trip_type IS NOT NULL")
+    assert result["trip_type"].tolist() == ["Long"]
+
+
+def test_refresh_over_adbc_matches_psycopg2(warehouse_server, warehouse, cache, tmp_path):
+    adbc = pytest.importorskip("adbc_driver_postgresql.dbapi")
+    arrow_cache = local_cache.LocalCache(str(tmp_path / "arrow_cache"), tables=["fact_trips"])
+    with adbc.connect(warehouse_server.get_uri()) as conn:
+        assert arrow_cache.refresh(conn) == {"fact_trips": 2}
+    cache.refresh(warehouse)
+
+    query = 'SELECT * FROM prod.fact_trips ORDER BY "date", route'
+    pd.testing.assert_frame_equal(arrow_cache.read_sql(query), cache.read_sql(query))
+
+
+def test_refresh_spills_days_over_the_memory_budget(warehouse, cache, monkeypatch):
+    with warehouse.cursor() as cur:
+        cur.execute("INSERT INTO prod.fact_trips SELECT %s, i %% 7, 1, i FROM generate_series(1, 1000) AS i;", (DAY,))
+    warehouse.commit()
+    # Every fetched chunk goes over the budget and is written as its own row group
+    monkeypatch.setattr(local_cache, "FETCH_CHUNK_ROWS", 300)
+    monkeypatch.setattr(local_cache, "MEMORY_BUDGET_MB", 0)
+    cache.refresh(warehouse)
+
+    path = cache.cache_dir + f"/fact_trips/date={DAY.isoformat()}/part-0.parquet"
+    assert local_cache.pq.ParquetFile(path).metadata.num_row_groups == 4
+    result = cache.read_sql('SELECT COUNT(*) AS n, SUM(sum_travel_time) AS stt FROM prod.fact_trips WHERE "date" = %(day)s',
+                            {"day": DAY})
+    assert result.to_dict("list") == {"n": [1002], "stt": [500640.0]}
+
+
+def test_shrink_frame_downcasts_ints_and_categorizes_repeated_strings():
+    frame = local_cache.shrink_frame(pd.DataFrame({
+        "route": [1, 2, 1, 2, 1, 2], "trip_type": ["a", "b", "a", "a", "b", "a"],
+        "id": ["u", "v", "w", "x", "y", "z"], "stt": [1.5, 2.5, 3.5, 4.5, 5.5, 6.5]}))
+
+    assert frame["route"].dtype == "int8"
+    assert frame["trip_type"].dtype == "category"
+    assert frame["id"].dtype != "category"
+    assert frame["stt"].dtype == "float64"
+
+
+def test_to_literal_query_inlines_dates_and_numbers():
+    query = local_cache.to_literal_query(
+        'SELECT 1 WHERE "date" >= %(day)s AND route = %(route)s', {"day": DAY, "route": 7})
+
+    assert query == "SELECT 1 WHERE \"date\" >= '2015-11-19' AND route = 7"
+    with pytest.raises(TypeError):
+        local_cache.to_literal_query("SELECT %(name)s", {"name": "'; DROP TABLE prod.fact_trips; --"})
+
+
+def test_to_duckdb_query_expands_tuples():
+    query, params = local_cache.to_duckdb_query(
+        "SELECT 1 WHERE a = %(a)s AND b IN %(b)s", {"a": 1, "b": (2, 3)})
+
+    assert query == "SELECT 1 WHERE a = $a AND b IN ($b_0, $b_1)"
+    assert params == {"a": 1, "b_0": 2, "b_1": 3}